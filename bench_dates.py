@@ -0,0 +1,140 @@
+"""Мікробенчмарк визначення дати публікації на збережених сторінках.
+
+Корпус — каталог з парами <name>.html / <name>.md та index.json:
+    {"<name>": {"url": "...", "expected": "2024-05-01T10:00:00" | null}}
+Поле expected заповнюється вручну (naive UTC); сторінки без нього рахуються лише за часом.
+
+    python bench_dates.py --record 5      # зберегти по 5 статей з кожного джерела config.json
+    python bench_dates.py                 # прогнати екстрактор по корпусу
+"""
+import argparse
+import json
+import hashlib
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:bench')
+import bot  # noqa: E402
+
+MATCH_TOLERANCE = timedelta(hours=12)  # запас на часові пояси сторінок без явного зсуву
+
+
+def legacy_extract(html: str, md: str) -> datetime | None:
+    """Попередній алгоритм (BeautifulSoup + dateparser) — для порівняння швидкості."""
+    from bs4 import BeautifulSoup
+    import dateparser
+    settings = {'TIMEZONE': 'UTC', 'RETURN_AS_TIMEZONE_AWARE': False}
+    soup = BeautifulSoup(html, 'html.parser')
+    candidates = [t.get('datetime') for t in soup.find_all('time') if t.get('datetime')]
+    candidates.extend(t.text for t in soup.find_all('time') if t.text)
+    for sel in ['meta[property="article:published_time"]', 'meta[name="article:published_time"]',
+                'meta[name="pubdate"]', 'meta[name="date"]']:
+        m = soup.select_one(sel)
+        if m and m.get('content'):
+            candidates.append(m['content'])
+    for c in candidates:
+        dt = dateparser.parse(c, settings=settings)
+        if dt:
+            return dt
+    if md:
+        return dateparser.parse(md[:2000], settings=settings)
+    return None
+
+
+def record(corpus: Path, per_source: int) -> None:
+    corpus.mkdir(parents=True, exist_ok=True)
+    index_path = corpus / 'index.json'
+    index = json.loads(index_path.read_text(encoding='utf-8')) if index_path.exists() else {}
+    for category, urls in bot.NEWS_SOURCES.items():
+        for listing_url in urls:
+            listing_md = bot.fetch_markdown_anycrawl(listing_url)
+            links = bot.extract_recent_articles_markdown(listing_md, listing_url)[:per_source]
+            for link in links:
+                res = bot.anycrawl.scrape(link['url'], formats=('html', 'markdown'))
+                if not res:
+                    continue
+                _, data = res
+                name = f"{bot._url_host(link['url'])}_{hashlib.sha1(link['url'].encode()).hexdigest()[:8]}"
+                (corpus / f'{name}.html').write_text(data.get('html') or '', encoding='utf-8')
+                (corpus / f'{name}.md').write_text(data.get('markdown') or '', encoding='utf-8')
+                index.setdefault(name, {'url': link['url'], 'category': category, 'expected': None})
+                print(f'saved {name} <- {link["url"]}')
+    index_path.write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+def _time_call(fn, html: str, md: str, repeat: int) -> tuple[float, datetime | None]:
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            result = fn(html, md)
+        except Exception:
+            result = None
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, result
+
+
+def _matches(found: datetime | None, expected: str | None) -> bool | None:
+    if not expected:
+        return None
+    return found is not None and abs(found - datetime.fromisoformat(expected)) <= MATCH_TOLERANCE
+
+
+def run(corpus: Path, repeat: int, with_legacy: bool) -> int:
+    index_path = corpus / 'index.json'
+    if not index_path.exists():
+        print(f'Корпус {corpus} порожній — спершу запустіть з --record', file=sys.stderr)
+        return 1
+    index = json.loads(index_path.read_text(encoding='utf-8'))
+    rows = []
+    for name, meta in sorted(index.items()):
+        html_path, md_path = corpus / f'{name}.html', corpus / f'{name}.md'
+        html = html_path.read_text(encoding='utf-8') if html_path.exists() else ''
+        md = md_path.read_text(encoding='utf-8') if md_path.exists() else ''
+        new_ms, new_dt = _time_call(bot.extract_published_at, html, md, repeat)
+        old_ms, old_dt = _time_call(legacy_extract, html, md, repeat) if with_legacy else (None, None)
+        rows.append((name, new_ms, new_dt, _matches(new_dt, meta.get('expected')),
+                     old_ms, old_dt, _matches(old_dt, meta.get('expected'))))
+
+    def mark(ok: bool | None) -> str:
+        return '-' if ok is None else ('+' if ok else 'x')
+
+    print(f"{'page':40} {'new ms':>8} {'ok':>3} {'legacy ms':>10} {'ok':>3}  new result")
+    for name, new_ms, new_dt, new_ok, old_ms, _old_dt, old_ok in rows:
+        old_col = f'{old_ms:10.2f}' if old_ms is not None else f"{'':>10}"
+        print(f'{name[:40]:40} {new_ms:8.2f} {mark(new_ok):>3} {old_col} {mark(old_ok):>3}  {new_dt}')
+
+    def summary(label: str, times: list[float], oks: list[bool | None]) -> None:
+        labelled = [ok for ok in oks if ok is not None]
+        acc = f'{sum(labelled)}/{len(labelled)}' if labelled else 'n/a (немає expected)'
+        found = sum(1 for r in rows if (r[2] if label == 'new' else r[5]) is not None)
+        print(f'{label:7} p50={statistics.median(times):.2f}ms max={max(times):.2f}ms '
+              f'total={sum(times):.1f}ms found={found}/{len(rows)} accuracy={acc}')
+
+    print()
+    summary('new', [r[1] for r in rows], [r[3] for r in rows])
+    if with_legacy:
+        summary('legacy', [r[4] for r in rows], [r[6] for r in rows])
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', type=Path, default=Path('bench_corpus'))
+    parser.add_argument('--record', type=int, metavar='N', help='зберегти N статей з кожного джерела і вийти')
+    parser.add_argument('--repeat', type=int, default=5, help='повторів на сторінку (береться медіана)')
+    parser.add_argument('--no-legacy', action='store_true', help='не порівнювати з BeautifulSoup-версією')
+    args = parser.parse_args()
+    if args.record:
+        record(args.corpus, args.record)
+        return 0
+    return run(args.corpus, args.repeat, not args.no_legacy)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
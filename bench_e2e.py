@@ -0,0 +1,234 @@
+"""Офлайн end-to-end бенчмарк основних сценаріїв бота на локальних фейках (bench_fakes.py).
+
+Проганяє:
+  news    — handle_news_category: збір listing/статей через фейковий AnyCrawl, map-reduce у фейковому Gemini,
+            стрімінг у фейковий Telegram (перший прогін — з холодним кешем, далі кеш скрапінгу теплий)
+  mail    — handle_mail_query: список листів через фейковий Gmail
+  gmail   — gmail_watcher_tick: один тік наглядача пошти (через тік приходять нові листи)
+  sheets  — sheets_watcher_tick: один тік наглядача таблиці (через тік таблиця змінюється)
+З --users N наглядачі обслуговують N користувачів зі спільною таблицею і окремим станом пошти.
+і друкує p50/p90/p99 та кількість викликів кожного сервісу. Усі файли бота — у тимчасовому каталозі.
+
+    python bench_e2e.py --iterations 10
+    python bench_e2e.py --save before.json          # зберегти результат
+    python bench_e2e.py --compare before.json       # порівняти з попереднім прогоном
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from bench_fakes import FakeAnyCrawlServer, FakeGemini, FakeGmailService, FakeSheet, FakeTelegram, SyntheticSites
+
+REPO_DIR = Path(__file__).resolve().parent
+USER_ID = 4242
+JOB_TIMEOUT_SEC = 300
+
+
+def percentiles(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {'n': len(ordered), 'p50': pct(50), 'p90': pct(90), 'p99': pct(99),
+            'max': ordered[-1], 'mean': statistics.mean(ordered)}
+
+
+def prepare_environment(workdir: Path, anycrawl_url: str) -> None:
+    """Змінні оточення і робочий каталог до import bot: усі SQLite/JSON-файли бота — у workdir."""
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '0:bench',
+        'ANYCRAWL_API_KEY': 'bench',
+        'ANYCRAWL_API_URL': anycrawl_url,
+        'SCRAPE_CACHE_PATH': str(workdir / 'scrape_cache.sqlite3'),
+        'NEWS_DIGESTS_FILE': str(workdir / 'news_digests.json'),
+        'GMAIL_SEEN_DB': str(workdir / 'gmail_seen.sqlite3'),
+        'GOOGLE_TOKEN_FILE': str(workdir / 'token.json'),
+        'SHEET_APPEND_JOURNAL': str(workdir / 'list_add_journal.jsonl'),
+    })
+    (workdir / 'token.json').write_text('{}', encoding='utf-8')  # наглядач пошти чекає на наявність token.json
+    shutil.copy(REPO_DIR / 'config.json', workdir / 'config.json')
+    os.chdir(workdir)
+
+
+class Bench:
+    def __init__(self, bot, args, anycrawl: FakeAnyCrawlServer, listings: list[str]):
+        self.bot = bot
+        self.args = args
+        self.anycrawl = anycrawl
+        self.gemini = FakeGemini(latency=args.gemini_latency)
+        self.gmail = FakeGmailService(latency=args.gmail_latency)
+        self.sheet = FakeSheet(latency=args.sheets_latency)
+        self.telegram = FakeTelegram(latency=args.telegram_latency)
+        self.samples: dict[str, list[float]] = {}
+        self.per_tick: dict[str, Counter] = {}
+        self._done: dict[int, threading.Event] = {}
+
+        from telebot import apihelper
+        apihelper.CUSTOM_REQUEST_SENDER = self.telegram
+        bot.model = self.gemini
+        bot.get_gmail_service = lambda user: self.gmail
+        bot._gs_client = object()
+        bot._gs_sheets[bot.SHEET_NAME] = self.sheet
+        token = os.environ['GOOGLE_TOKEN_FILE']
+        bot.user_registry = bot.UserRegistry(
+            [bot.UserProfile(USER_ID, owner=True, primary=True)]
+            + [bot.UserProfile(USER_ID + n, gmail_token=token) for n in range(1, args.users)])
+        bot.NEWS_SOURCES['ai_news'] = listings
+        self.gmail.deliver(15)
+        # Позначаємо завершення фонових завдань, щоб міряти повний сценарій, а не лише відповідь обробника
+        for name in ('_refresh_and_send_digest', '_mail_query_job'):
+            setattr(bot, name, self._signalling(getattr(bot, name)))
+
+    def _signalling(self, fn):
+        def wrapper(chat_id, *args):
+            try:
+                return fn(chat_id, *args)
+            finally:
+                self._done[chat_id].set()
+        return wrapper
+
+    def _callback(self, data: str, chat_id: int):
+        from telebot import types
+        return types.CallbackQuery.de_json({
+            'id': str(chat_id), 'chat_instance': 'bench', 'data': data,
+            'from': {'id': USER_ID, 'is_bot': False, 'first_name': 'bench'},
+            'message': {'message_id': 1, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'}},
+        })
+
+    def _wait_sends(self) -> None:
+        dispatcher = self.bot.send_dispatcher
+        while True:
+            with dispatcher._cond:
+                idle = not dispatcher._busy and not any(dispatcher._queues.values())
+            if idle:
+                return
+            time.sleep(0.005)
+
+    def _run_job(self, flow: str, handler, data: str, chat_id: int) -> None:
+        self._done[chat_id] = threading.Event()
+        started = time.perf_counter()
+        handler(self._callback(data, chat_id))
+        if not self._done[chat_id].wait(JOB_TIMEOUT_SEC):
+            print(f'{flow}: завдання не завершилось за {JOB_TIMEOUT_SEC}s', file=sys.stderr)
+            return
+        self._wait_sends()
+        finished = self.telegram.last_send.get(chat_id, time.perf_counter())
+        self.samples.setdefault(flow, []).append(finished - started)
+
+    def news(self, i: int) -> None:
+        bot = self.bot
+        # Кожен прогін — справжнє оновлення: без збереженого дайджесту і без кешу відповіді Gemini
+        with bot._digest_store_lock:
+            bot._digest_store.clear()
+        bot._digest_cache.clear()
+        self._run_job('news_cold' if i == 0 else 'news_warm', bot.handle_news_category, 'ai_news', 100_000 + i)
+
+    def mail(self, i: int) -> None:
+        self._run_job('mail', self.bot.handle_mail_query, 'mail_unread_12h', 200_000 + i)
+
+    def _tick(self, flow: str, fn, calls: Counter) -> None:
+        before = Counter(calls)
+        started = time.perf_counter()
+        fn()
+        self.samples.setdefault(flow, []).append(time.perf_counter() - started)
+        self.per_tick.setdefault(flow, Counter()).update(calls - before)
+
+    def gmail_tick(self, i: int) -> None:
+        if i % 2 == 0:
+            self.gmail.deliver(self.args.mails_per_tick)
+        self._tick('gmail_tick', self.bot.gmail_watcher_tick, self.gmail.calls)
+
+    def sheets_tick(self, i: int) -> None:
+        if i % 2 == 0:
+            self.sheet.touch(f'bench {i}')
+        self._tick('sheets_tick', self.bot.sheets_watcher_tick, self.sheet.calls)
+
+    def run(self, flows: list[str]) -> dict:
+        steps = {'news': self.news, 'mail': self.mail, 'gmail': self.gmail_tick, 'sheets': self.sheets_tick}
+        for flow in flows:
+            for i in range(self.args.iterations):
+                steps[flow](i)
+        self._wait_sends()
+        iterations = self.args.iterations
+        return {
+            'latency': {flow: percentiles(s) for flow, s in self.samples.items()},
+            'calls': {
+                'anycrawl': dict(self.anycrawl.calls),
+                'gemini': dict(self.gemini.calls),
+                'gmail': dict(self.gmail.calls),
+                'sheets': dict(self.sheet.calls),
+                'telegram': dict(self.telegram.calls),
+            },
+            'per_tick': {flow: {op: n / iterations for op, n in c.items()} for flow, c in self.per_tick.items()},
+        }
+
+
+def print_report(result: dict, previous: dict | None) -> None:
+    print(f"{'flow':12} {'n':>4} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}  {'Δp50':>8}")
+    for flow, st in result['latency'].items():
+        delta = ''
+        old = (previous or {}).get('latency', {}).get(flow)
+        if old:
+            delta = f"{(st['p50'] / old['p50'] - 1) * 100:+7.1f}%" if old['p50'] else ''
+        print(f"{flow:12} {st['n']:4} {st['p50'] * 1000:9.1f} {st['p90'] * 1000:9.1f} "
+              f"{st['p99'] * 1000:9.1f} {st['max'] * 1000:9.1f}  {delta:>8}")
+    print()
+    for service, calls in result['calls'].items():
+        print(f'{service:9} {dict(sorted(calls.items()))}')
+    for flow, ops in result['per_tick'].items():
+        print(f'{flow} викликів API на тік: {ops}')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--flows', default='news,mail,gmail,sheets')
+    parser.add_argument('--corpus', type=Path, help='записані сторінки bench_dates.py замість згенерованих')
+    parser.add_argument('--sites', type=int, default=3)
+    parser.add_argument('--articles', type=int, default=12, help='статей на сайт (половина свіжі)')
+    parser.add_argument('--mails-per-tick', type=int, default=3)
+    parser.add_argument('--users', type=int, default=1, help='користувачів у наглядачах пошти і таблиці')
+    parser.add_argument('--anycrawl-latency', type=float, default=0.15)
+    parser.add_argument('--gemini-latency', type=float, default=0.4)
+    parser.add_argument('--gmail-latency', type=float, default=0.08)
+    parser.add_argument('--sheets-latency', type=float, default=0.12)
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--save', type=Path, help='зберегти результат у JSON')
+    parser.add_argument('--compare', type=Path, help='JSON попереднього прогону для порівняння')
+    parser.add_argument('--verbose', action='store_true', help='не приглушувати лог бота')
+    args = parser.parse_args()
+
+    sites = SyntheticSites.from_corpus(args.corpus) if args.corpus else \
+        SyntheticSites(sites=args.sites, articles=args.articles, fresh=args.articles // 2)
+    anycrawl = FakeAnyCrawlServer(sites, latency=args.anycrawl_latency).start()
+    workdir = Path(tempfile.mkdtemp(prefix='bench_e2e_'))
+    previous = json.loads(args.compare.read_text(encoding='utf-8')) if args.compare else None
+    prepare_environment(workdir, anycrawl.url)
+    sys.path.insert(0, str(REPO_DIR))
+    import bot
+    if not args.verbose:
+        bot.logger.setLevel(logging.WARNING)
+    try:
+        result = Bench(bot, args, anycrawl, sites.listings).run([f.strip() for f in args.flows.split(',') if f.strip()])
+    finally:
+        anycrawl.stop()
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_report(result, previous)
+    if args.save:
+        args.save.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
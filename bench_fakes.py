@@ -0,0 +1,382 @@
+"""Локальні замінники зовнішніх сервісів для офлайн-бенчмарків (bench_e2e.py, bench_webhook.py).
+
+AnyCrawl — справжній HTTP-сервер (бот ходить до нього через свою requests-сесію),
+Gemini / Gmail / gspread — об'єкти з тим самим інтерфейсом, що використовує bot.py,
+Telegram — підміна транспорту telebot (apihelper.CUSTOM_REQUEST_SENDER).
+Усі фейки мають налаштовувану затримку і рахують виклики.
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+
+def _sleep(latency: float, jitter: float = 0.2) -> None:
+    if latency > 0:
+        time.sleep(latency * random.uniform(1 - jitter, 1 + jitter))
+
+
+# ----------------------- AnyCrawl -----------------------
+
+class SyntheticSites:
+    """Згенеровані сторінки новинних сайтів: listing з посиланнями і статті з датою в meta.
+
+    На кожному сайті перші fresh статей опубліковані годину тому, решта — три дні тому,
+    щоб спрацьовували і фільтр давності, і серія застарілих статей.
+    """
+
+    def __init__(self, sites: int = 3, articles: int = 12, fresh: int = 6, body_chars: int = 3000):
+        self.pages: dict[str, tuple[str, str]] = {}  # url -> (html, markdown)
+        self.listings: list[str] = []
+        now = datetime.now(timezone.utc)
+        filler = ('Компанія оголосила про нову модель, яка за внутрішніми тестами на 12% швидша. '
+                  'Реліз запланований на наступний квартал, ціну поки не розкрито. ')
+        for s in range(sites):
+            host = f'https://site{s}.bench.local'
+            listing = f'{host}/news/'
+            links = []
+            for a in range(articles):
+                published = now - (timedelta(hours=1 + a) if a < fresh else timedelta(days=3, hours=a))
+                url = f'{host}/news/{published:%Y/%m/%d}/story-about-topic-{a}'
+                title = f'Новина {a} з сайту {s}'
+                body = (filler * (body_chars // len(filler) + 1))[:body_chars]
+                html = (f'<html><head><title>{title}</title>'
+                        f'<meta property="article:published_time" content="{published:%Y-%m-%dT%H:%M:%S}Z">'
+                        f'</head><body><h1>{title}</h1><p>{body}</p></body></html>')
+                self.pages[url] = (html, f'# {title}\n\n{body}')
+                links.append(f'- [{title}]({url})')
+            nav = f'[Головна]({host}/) [Про нас]({host}/about/) [Теги]({host}/tag/tech/)'
+            self.pages[listing] = ('', f'{nav}\n\n# Останні новини\n\n' + '\n'.join(links))
+            self.listings.append(listing)
+
+    @classmethod
+    def from_corpus(cls, corpus: Path) -> 'SyntheticSites':
+        """Записані сторінки з bench_dates.py --record; listing для кожного сайту генерується з їхніх URL."""
+        self = cls.__new__(cls)
+        self.pages, self.listings = {}, []
+        index = json.loads((corpus / 'index.json').read_text(encoding='utf-8'))
+        by_host: dict[str, list[str]] = {}
+        for name, meta in index.items():
+            html_path, md_path = corpus / f'{name}.html', corpus / f'{name}.md'
+            html = html_path.read_text(encoding='utf-8') if html_path.exists() else ''
+            md = md_path.read_text(encoding='utf-8') if md_path.exists() else ''
+            self.pages[meta['url']] = (html, md)
+            by_host.setdefault(urlparse(meta['url']).netloc, []).append(meta['url'])
+        for host, urls in by_host.items():
+            listing = f'https://{host}/'
+            self.pages[listing] = ('', '\n'.join(f'- [{u.rsplit("/", 1)[-1] or u}]({u})' for u in urls))
+            self.listings.append(listing)
+        return self
+
+
+class FakeAnyCrawlServer:
+    """HTTP-сервер з API AnyCrawl /v1/scrape поверх SyntheticSites."""
+
+    def __init__(self, sites: SyntheticSites, latency: float = 0.1, engine_latency: dict[str, float] | None = None):
+        self.sites = sites
+        self.latency = latency
+        self.engine_latency = engine_latency or {'playwright': latency * 3}
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                status, payload = fake.scrape(body)
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        self.httpd = Server(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}/v1/scrape'
+
+    def scrape(self, body: dict) -> tuple[int, dict]:
+        engine = body.get('engine', 'cheerio')
+        with self._lock:
+            self.calls[engine] += 1
+        _sleep(self.engine_latency.get(engine, self.latency))
+        page = self.sites.pages.get(body.get('url', ''))
+        if page is None:
+            return 200, {'success': False, 'error': 'not found'}
+        html, md = page
+        data = {'status': 'completed', 'url': body['url']}
+        formats = body.get('formats') or ['markdown']
+        if 'markdown' in formats:
+            data['markdown'] = md
+        if 'html' in formats:
+            data['html'] = html
+        return 200, {'success': True, 'data': data}
+
+    def start(self) -> 'FakeAnyCrawlServer':
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+
+
+# ----------------------- Gemini -----------------------
+
+class _TokenCount:
+    def __init__(self, n: int):
+        self.total_tokens = n
+
+
+class _GeminiResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGemini:
+    """generate_content / count_tokens як у google.generativeai.GenerativeModel.
+
+    Затримка = latency + chars_per_sec-швидкість «генерації»; у stream-режимі відповідь іде шматками.
+    """
+
+    def __init__(self, latency: float = 0.3, chars_per_sec: float = 4000, answer_chars: int = 1500):
+        self.latency = latency
+        self.chars_per_sec = chars_per_sec
+        self.answer_chars = answer_chars
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.calls[kind] += 1
+
+    def _answer(self, prompt: str) -> str:
+        if prompt.startswith('Стисни'):
+            return 'Стислий зміст: компанія представила модель, реліз у наступному кварталі, +12% швидкості.'
+        line = '• Пункт дайджесту з фактами, датами і цифрами.\n'
+        return (line * (self.answer_chars // len(line) + 1))[:self.answer_chars] + '\nВисновок: тестовий.'
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        kind = 'map' if prompt.startswith('Стисни') else 'reduce'
+        self._count(f'{kind}_stream' if stream else kind)
+        text = self._answer(prompt)
+        _sleep(self.latency)
+        if not stream:
+            _sleep(len(text) / self.chars_per_sec, 0)
+            return _GeminiResponse(text)
+        return self._stream(text)
+
+    def _stream(self, text: str, chunk: int = 200):
+        for i in range(0, len(text), chunk):
+            _sleep(chunk / self.chars_per_sec, 0)
+            yield _GeminiResponse(text[i:i + chunk])
+
+    def count_tokens(self, text: str) -> _TokenCount:
+        self._count('count_tokens')
+        _sleep(0.02)
+        return _TokenCount(len(text) // 4)
+
+
+# ----------------------- Gmail -----------------------
+
+class _GmailHttpError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f'HTTP {status}')
+        self.resp = type('Resp', (), {'status': status})()
+
+
+class _Request:
+    def __init__(self, fake: 'FakeGmailService', op: str, fn):
+        self.fake, self.op, self.fn = fake, op, fn
+
+    def execute(self):
+        self.fake._count(self.op)
+        _sleep(self.fake.latency)
+        return self.fn()
+
+
+class _Batch:
+    def __init__(self, fake: 'FakeGmailService', callback):
+        self.fake, self.callback, self.items = fake, callback, []
+
+    def add(self, request: _Request, request_id: str) -> None:
+        self.items.append((request, request_id))
+
+    def execute(self) -> None:
+        # Один HTTP-запит на весь batch: одна затримка
+        self.fake._count('batch')
+        _sleep(self.fake.latency)
+        for request, request_id in self.items:
+            self.callback(request_id, request.fn(), None)
+
+
+class FakeGmailService:
+    """Підмножина Gmail API v1, яку використовує bot.py: users().getProfile/messages/history, batch."""
+
+    def __init__(self, latency: float = 0.08):
+        self.latency = latency
+        self.history_id = 1000
+        self._inbox: dict[str, int] = {}  # id -> historyId появи
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, op: str) -> None:
+        with self._lock:
+            self.calls[op] += 1
+
+    def deliver(self, n: int) -> list[str]:
+        ids = []
+        with self._lock:
+            for _ in range(n):
+                self.history_id += 1
+                mid = f'm{self.history_id}'
+                self._inbox[mid] = self.history_id
+                ids.append(mid)
+        return ids
+
+    # users() / messages() / history() повертають той самий об'єкт — як ланцюжок у googleapiclient
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return self
+
+    def getProfile(self, userId):
+        return _Request(self, 'getProfile', lambda: {'historyId': str(self.history_id)})
+
+    def list(self, userId, q=None, maxResults=None, startHistoryId=None, historyTypes=None, labelId=None, pageToken=None):
+        if startHistoryId is not None:
+            def history():
+                start = int(startHistoryId)
+                added = [{'messagesAdded': [{'message': {'id': mid, 'labelIds': ['INBOX', 'UNREAD']}}]}
+                         for mid, hid in self._inbox.items() if hid > start]
+                return {'history': added, 'historyId': str(self.history_id)}
+            return _Request(self, 'history.list', history)
+        newest = sorted(self._inbox, key=self._inbox.get, reverse=True)[:maxResults or 20]
+        return _Request(self, 'messages.list', lambda: {'messages': [{'id': m} for m in newest]})
+
+    def get(self, userId, id, format=None, metadataHeaders=None):
+        headers = [{'name': 'Subject', 'value': f'Лист {id}'}, {'name': 'From', 'value': 'bench@example.com'},
+                   {'name': 'Date', 'value': 'Fri, 17 Oct 2025 10:00:00 +0000'}]
+        return _Request(self, 'messages.get', lambda: {'id': id, 'snippet': f'Текст листа {id}', 'payload': {'headers': headers}})
+
+    def new_batch_http_request(self, callback):
+        return _Batch(self, callback)
+
+
+# ----------------------- Google Sheets -----------------------
+
+class _FakeSpreadsheet:
+    def __init__(self, sheet: 'FakeSheet'):
+        self.sheet = sheet
+
+    def get_lastUpdateTime(self) -> str:
+        self.sheet._count('lastUpdateTime')
+        _sleep(self.sheet.latency)
+        return f'v{self.sheet.version}'
+
+
+class FakeSheet:
+    """Аркуш gspread: get_all_values, get(range), append_rows і spreadsheet.get_lastUpdateTime()."""
+
+    def __init__(self, rows: int = 50, latency: float = 0.1):
+        self.latency = latency
+        self.rows = [[f'позиція {i}', '2025-10-17 10:00'] for i in range(rows)]
+        self.version = 1
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        self.spreadsheet = _FakeSpreadsheet(self)
+
+    def _count(self, op: str) -> None:
+        with self._lock:
+            self.calls[op] += 1
+
+    def get_all_values(self) -> list[list[str]]:
+        self._count('get_all_values')
+        _sleep(self.latency)
+        return [list(r) for r in self.rows]
+
+    def get(self, _range: str) -> list[list[str]]:
+        self._count('get')
+        _sleep(self.latency)
+        return [list(r[:2]) for r in self.rows]
+
+    def append_rows(self, rows, value_input_option=None) -> None:
+        self._count('append_rows')
+        _sleep(self.latency)
+        with self._lock:
+            self.rows.extend(list(r) for r in rows)
+            self.version += 1
+
+    def touch(self, item: str) -> None:
+        """Зміна «ззовні» (інший користувач таблиці)."""
+        with self._lock:
+            self.rows.append([item, '2025-10-17 11:00'])
+            self.version += 1
+
+
+# ----------------------- Telegram -----------------------
+
+class FakeResponse:
+    def __init__(self, result):
+        self.status_code = 200
+        self._payload = {'ok': True, 'result': result}
+        self.text = json.dumps(self._payload)
+
+    def json(self):
+        return self._payload
+
+
+class FakeTelegram:
+    """Транспорт Bot API для apihelper.CUSTOM_REQUEST_SENDER: відповідає із затримкою і фіксує відправки.
+
+    replied — час першого sendMessage/editMessageText по чату, last_send — останнього.
+    """
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.replied: dict[int, float] = {}
+        self.last_send: dict[int, float] = {}
+        self.calls: Counter = Counter()
+        self.all_replied = threading.Event()
+        self.expected = 0
+        self._message_id = 0
+
+    def __call__(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        name = url.rsplit('/', 1)[-1]
+        time.sleep(self.latency)
+        params = params or {}
+        with self.lock:
+            self.calls[name] += 1
+        if name == 'getMe':
+            return FakeResponse({'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'})
+        if name in ('sendMessage', 'editMessageText'):
+            chat_id = int(params.get('chat_id', 0))
+            now = time.perf_counter()
+            with self.lock:
+                self._message_id += 1
+                message_id = int(params.get('message_id') or self._message_id)
+                self.replied.setdefault(chat_id, now)
+                self.last_send[chat_id] = now
+                if self.expected and len(self.replied) >= self.expected:
+                    self.all_replied.set()
+            return FakeResponse({'message_id': message_id, 'date': int(time.time()),
+                                 'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')})
+        return FakeResponse(True)
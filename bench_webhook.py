@@ -0,0 +1,107 @@
+"""Навантажувальний тест webhook-режиму без Telegram.
+
+Піднімає bot.WebhookServer на локальному порту, підміняє відправку запитів до Bot API
+(telebot.apihelper.CUSTOM_REQUEST_SENDER) фейком і шле N апдейтів /start з різних чатів.
+Рахує пропускну здатність прийому апдейтів і затримку «апдейт прийнято → відповідь відправлено».
+
+    python bench_webhook.py --updates 500 --concurrency 16 --api-latency 0.05
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:bench')
+import bot  # noqa: E402
+from telebot import apihelper  # noqa: E402
+from bench_fakes import FakeTelegram  # noqa: E402
+
+SECRET = 'bench-secret'
+
+
+def make_update(update_id: int, chat_id: int) -> bytes:
+    return json.dumps({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': '/start',
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'bench'},
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }).encode()
+
+
+def post(port: int, body: bytes, secret: str) -> int:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        conn.request('POST', '/tg', body=body, headers={
+            'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret})
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+def pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=16, help='паралельних HTTP-клієнтів')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='затримка фейкового Bot API, с')
+    parser.add_argument('--respect-limits', action='store_true',
+                        help='не знімати глобальний ліміт черги відправки (25/с) — міряти з ним')
+    args = parser.parse_args()
+
+    fake = FakeTelegram(args.api_latency)
+    fake.expected = args.updates
+    apihelper.CUSTOM_REQUEST_SENDER = fake
+    if not args.respect_limits:
+        bot.send_dispatcher._global.rate = bot.send_dispatcher._global.burst = 1e6
+    server = bot.WebhookServer(bot.bot, listen='127.0.0.1', port=0, path='/tg', secret=SECRET)
+    server.start()
+
+    assert post(server.port, make_update(0, 1), 'wrong') == 403, 'невірний secret має відхилятись'
+
+    base_chat = 10_000
+    posted: dict[int, float] = {}
+    accept_ms: list[float] = []
+
+    def send_one(i: int) -> None:
+        chat_id = base_chat + i
+        body = make_update(i + 1, chat_id)
+        started = time.perf_counter()
+        posted[chat_id] = started
+        status = post(server.port, body, SECRET)
+        accept_ms.append((time.perf_counter() - started) * 1000)
+        if status != 200:
+            print(f'update {i}: HTTP {status}', file=sys.stderr)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(send_one, range(args.updates)))
+    accepted_in = time.perf_counter() - started
+    fake.all_replied.wait(timeout=120)
+    done_in = time.perf_counter() - started
+    server.stop()
+
+    latencies = [(fake.replied[c] - t) * 1000 for c, t in posted.items() if c in fake.replied]
+    print(f'апдейтів: {args.updates}, паралельно: {args.concurrency}, затримка API: {args.api_latency * 1000:.0f}ms')
+    print(f'прийом:    {args.updates / accepted_in:8.1f} апд/с  '
+          f'HTTP p50={pct(accept_ms, 50):.1f}ms p99={pct(accept_ms, 99):.1f}ms')
+    if latencies:
+        print(f'відповідь: {len(latencies) / done_in:8.1f} відп/с  '
+              f'p50={pct(latencies, 50):.1f}ms p90={pct(latencies, 90):.1f}ms p99={pct(latencies, 99):.1f}ms '
+              f'max={max(latencies):.1f}ms mean={statistics.mean(latencies):.1f}ms')
+    print(f'відповіли {len(latencies)}/{args.updates}; сервер {server.stats}; виклики API {fake.calls}')
+    return 0 if len(latencies) == args.updates else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,40 +1,137 @@
 import os
+import sys  # Для sys.stdout
+import time as _time
+
+# BOT_PROFILE_STARTUP=1 (саме змінна оточення, .env ще не прочитано): час кожного import цього файлу
+# і час від старту процесу до першого getUpdates — щоб регресії старту було видно
+_STARTUP_PROFILE = os.getenv('BOT_PROFILE_STARTUP') == '1'
+_STARTUP_T0 = _time.perf_counter()
+_import_timings: list[tuple[str, float, float]] = []  # (модуль, секунд, момент від _STARTUP_T0)
+if _STARTUP_PROFILE:
+    import builtins
+    _builtin_import = builtins.__import__
+
+    def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        # Рахуємо лише import-и самого bot.py; вкладені входять у час свого батька
+        if not globals or globals.get('__name__') != __name__:
+            return _builtin_import(name, globals, locals, fromlist, level)
+        started = _time.perf_counter()
+        try:
+            return _builtin_import(name, globals, locals, fromlist, level)
+        finally:
+            _import_timings.append((name, _time.perf_counter() - started, started - _STARTUP_T0))
+
+    builtins.__import__ = _timed_import
+
 import telebot
 from dotenv import load_dotenv
-from google.generativeai import configure, GenerativeModel  # Припускаємо використання google-generativeai для Gemini
 import logging  # Додано для логування
 import json  # Для читання config.json
-import requests  # Для HTTP запитів
-import sys  # Для sys.stdout
+import requests  # Для HTTP запитів (telebot однаково його вантажить)
 from telebot import types  # Для інлайн-кнопок та reply-клавіатури
+from telebot.apihelper import ApiTelegramException
 from requests.utils import requote_uri
-from bs4 import BeautifulSoup
-import dateparser
-from datetime import datetime, timedelta
-from google.oauth2.credentials import Credentials as UserCredentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from datetime import datetime, timedelta, timezone
+import re
 import threading
-import time as _time
 from pathlib import Path
-from typing import Optional
-import gspread
-from google.oauth2.service_account import Credentials as ServiceAccountCredentials
+from urllib.parse import urlparse, urlunparse
+import sqlite3
+import hashlib
+import random
+import signal
+import hmac
+import atexit
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+
+# Завантажуємо змінні середовища з .env (до налаштування логування, бо LOG_* теж можуть бути там)
+load_dotenv()
 
-# Налаштування логування
-logging.basicConfig(filename='bot.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')  # Змінено на DEBUG для дебагу
+# Налаштування логування: потоки бота лише кладуть запис у чергу, а у файл і термінал пише окремий потік
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_MAX_MESSAGE = 2000  # довші повідомлення (відповіді API тощо) обрізаються
+LOG_SAMPLE_BURST = 5  # однакових повідомлень за вікно, решта лише рахується
+LOG_SAMPLE_WINDOW_SEC = 60
+# extra=LOG_SAMPLED позначає повторювані повідомлення тіків наглядачів/планувальника, які можна семплювати
+LOG_SAMPLED = {'sampled': True}
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class _TruncatingFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if len(text) > LOG_MAX_MESSAGE:
+            text = f'{text[:LOG_MAX_MESSAGE]}… (+{len(text) - LOG_MAX_MESSAGE} символів)'
+        return text
+
+
+class _SamplingFilter(logging.Filter):
+    """Обмежує повтори однакових позначених записів (extra=LOG_SAMPLED) до LOG_SAMPLE_BURST за вікно.
+
+    Семплюються лише DEBUG/INFO з позначкою; попередження й помилки проходять завжди.
+    Перший запис нового вікна отримує примітку, скільки таких пропущено.
+    """
+
+    MAX_KEYS = 1000
+
+    def __init__(self, burst: int = LOG_SAMPLE_BURST, window: float = LOG_SAMPLE_WINDOW_SEC):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        self._seen: dict[tuple, list] = {}  # (logger, рівень, текст) -> [початок вікна, пропущено, показано]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not getattr(record, 'sampled', False):
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = _time.monotonic()
+        with self._lock:
+            state = self._seen.get(key)
+            if state is None or now - state[0] >= self.window:
+                if len(self._seen) >= self.MAX_KEYS:
+                    self._seen.clear()
+                suppressed = state[1] if state else 0
+                self._seen[key] = [now, 0, 1]
+                if suppressed:
+                    record.msg = f'{record.msg} (ще {suppressed} таких пропущено за {self.window:g}s)'
+                return True
+            if state[2] < self.burst:
+                state[2] += 1
+                return True
+            state[1] += 1
+            return False
+
+
+def _setup_logging() -> QueueListener:
+    formatter = _TruncatingFormatter(LOG_FORMAT)
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    console_handler = logging.StreamHandler(sys.stdout)
+    for h in (file_handler, console_handler):
+        h.setFormatter(formatter)
+    queue_handler = QueueHandler(SimpleQueue())
+    queue_handler.addFilter(_SamplingFilter())
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    listener = QueueListener(queue_handler.queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Дописуємо чергу у файл при завершенні процесу
+    atexit.register(listener.stop)
+    return listener
+
+
+_log_listener = _setup_logging()
 logger = logging.getLogger(__name__)
-logger.debug('Тестовий дебаг лог: Логування працює')
-
-# Додаємо хендлер для виводу в термінал
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(logging.DEBUG)
-stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(stream_handler)
-
-# Завантажуємо змінні середовища з .env
-load_dotenv()
 
 # Ключі з .env
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
@@ -43,11 +140,24 @@ ANYCRAWL_KEY = os.getenv('ANYCRAWL_API_KEY')
 ALLOWED_USER_ID = os.getenv('ALLOWED_USER_ID')
 ALLOWED_USER_ID_INT = int(ALLOWED_USER_ID) if ALLOWED_USER_ID and ALLOWED_USER_ID.isdigit() else None
 
-# Налаштування Gemini
-configure(api_key=GEMINI_KEY)
-model = GenerativeModel('gemini-2.0-flash')
+# Gemini: google.generativeai важкий (grpc/protobuf), тож вантажимо його при першому запиті
+GEMINI_MODEL_NAME = 'gemini-2.0-flash'
+model = None
+_model_lock = threading.Lock()
+
+
+def _genai_model():
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                from google.generativeai import configure, GenerativeModel
+                configure(api_key=GEMINI_KEY)
+                model = GenerativeModel(GEMINI_MODEL_NAME)
+    return model
 
 # Завантажуємо конфіг новин
+_cfg: dict = {}
 try:
     with open('config.json', 'r', encoding='utf-8') as cf:
         _cfg = json.load(cf)
@@ -56,50 +166,473 @@ except Exception as e:
     logger.error(f'Не вдалося завантажити config.json: {e}')
     NEWS_SOURCES = {}
 
+NEWS_FETCH_WORKERS = int(os.getenv('NEWS_FETCH_WORKERS', '8'))  # глобальний ліміт одночасних запитів до AnyCrawl
+NEWS_FETCH_PER_HOST = int(os.getenv('NEWS_FETCH_PER_HOST', '2'))  # ліміт одночасних запитів на один сайт
+
+
+# ----------------------- МЕТРИКИ -----------------------
+# METRICS_ENABLED=0 вимикає збір: декоратори повертають функцію без обгортки, timed() — спільний no-op
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # >0 — Prometheus-текст на http://METRICS_LISTEN:PORT/metrics
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('registry', 'name', 'labels', 'started')
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, labels: tuple):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = _time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry._observe(self.name, self.labels, _time.perf_counter() - self.started)
+        if exc_type is not None:
+            self.registry._inc(f'{self.name}_errors', self.labels, 1)
+        return False
+
+
+class MetricsRegistry:
+    """Лічильники і гістограми затримок з мітками; віддає підсумок для /stats і текст Prometheus."""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._hists: dict[tuple[str, tuple], list] = {}  # [лічильники по кошиках..., +Inf, сума, кількість]
+
+    @staticmethod
+    def _labels(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        if self.enabled:
+            self._inc(name, self._labels(labels), value)
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        if self.enabled:
+            self._observe(name, self._labels(labels), seconds)
+
+    def timed(self, name: str, **labels):
+        """with metrics.timed('gemini_generate', mode='stream'): ... — час у гістограму, виняток у name_errors."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, self._labels(labels))
+
+    def instrument(self, name: str, **labels):
+        """Декоратор: кожен виклик функції — у гістограму name з міткою op=<ім'я функції>."""
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+            key = self._labels({'op': fn.__name__, **labels})
+
+            def wrapper(*args, **kwargs):
+                with _Timer(self, name, key):
+                    return fn(*args, **kwargs)
+
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            wrapper.__wrapped__ = fn
+            return wrapper
+        return decorate
+
+    def _inc(self, name: str, labels: tuple, value: float) -> None:
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + value
+
+    def _observe(self, name: str, labels: tuple, seconds: float) -> None:
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        with self._lock:
+            h = self._hists.get((name, labels))
+            if h is None:
+                h = self._hists[(name, labels)] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+
+    def _quantile(self, h: list, q: float) -> float:
+        # Верхня межа кошика, в який потрапляє квантиль (оцінка зверху)
+        target, seen = q * h[-1], 0
+        for i, bound in enumerate(self.buckets):
+            seen += h[i]
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def summary_lines(self) -> list[str]:
+        with self._lock:
+            hists = {k: list(v) for k, v in self._hists.items()}
+            counters = dict(self._counters)
+        lines = []
+        for (name, labels), h in sorted(hists.items()):
+            tag = ','.join(f'{k}={v}' for k, v in labels)
+            errors = counters.get((f'{name}_errors', labels), 0)
+            p50, p90, p99 = (self._quantile(h, q) for q in (0.5, 0.9, 0.99))
+            lines.append(f'{name}[{tag}] n={h[-1]} avg={h[-2] / h[-1] * 1000:.0f}ms '
+                         f'p50≤{p50:g}s p90≤{p90:g}s p99≤{p99:g}s' + (f' err={errors:g}' if errors else ''))
+        for (name, labels), value in sorted(counters.items()):
+            if name.endswith('_errors') and (name[:-7], labels) in hists:
+                continue
+            tag = ','.join(f'{k}={v}' for k, v in labels)
+            lines.append(f'{name}[{tag}] = {value:g}')
+        return lines
+
+    def prometheus_text(self) -> str:
+        def fmt(labels: tuple, extra: str = '') -> str:
+            parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+            return '{' + ','.join(parts) + '}' if parts else ''
+
+        with self._lock:
+            hists = {k: list(v) for k, v in self._hists.items()}
+            counters = dict(self._counters)
+        out = []
+        for name in sorted({n for n, _ in hists}):
+            out.append(f'# TYPE bot_{name}_seconds histogram')
+            for (n, labels), h in sorted(hists.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), h):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound:g}"'
+                    out.append(f'bot_{name}_seconds_bucket{fmt(labels, le)} {cumulative}')
+                out.append(f'bot_{name}_seconds_sum{fmt(labels)} {h[-2]:.6f}')
+                out.append(f'bot_{name}_seconds_count{fmt(labels)} {h[-1]}')
+        for name in sorted({n for n, _ in counters}):
+            out.append(f'# TYPE bot_{name}_total counter')
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    out.append(f'bot_{name}_total{fmt(labels)} {value:g}')
+        return '\n'.join(out) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+# ----------------------- КЕШ СКРАПІНГУ (SQLite) -----------------------
+_scrape_cache_cfg = _cfg.get('scrape_cache', {})
+SCRAPE_CACHE_PATH = os.getenv('SCRAPE_CACHE_PATH', 'scrape_cache.sqlite3')
+LISTING_CACHE_TTL_SEC = int(_scrape_cache_cfg.get('listing_ttl_minutes', 10)) * 60
+ARTICLE_CACHE_TTL_SEC = int(_scrape_cache_cfg.get('article_ttl_days', 7)) * 86400
+SCRAPE_CACHE_MAX_BYTES = int(_scrape_cache_cfg.get('max_size_mb', 50)) * 1024 * 1024
+
+
+def _url_host(url: str) -> str:
+    return (urlparse(url).hostname or '').lower()
+
+
+_TRACKING_PARAMS = {'fbclid', 'gclid', 'yclid', 'dclid', 'msclkid', 'igshid', 'mc_cid', 'mc_eid',
+                    'ref', 'ref_src', 'ref_url', '_ga', 'spm', 'cmpid', 'ocid', 'at_medium', 'at_campaign'}
+
+
+def canonical_url(url: str) -> str:
+    """Нормалізує URL: нижній регістр схеми/хоста, без фрагмента, стандартного порту і трекінгових параметрів."""
+    p = urlparse(url.strip())
+    scheme = (p.scheme or 'https').lower()
+    host = (p.hostname or '').lower()
+    if p.port and not ((scheme == 'http' and p.port == 80) or (scheme == 'https' and p.port == 443)):
+        host = f'{host}:{p.port}'
+    query = p.query
+    if query:
+        kept = [kv for kv in query.split('&')
+                if kv and not kv.split('=', 1)[0].lower().startswith('utm_')
+                and kv.split('=', 1)[0].lower() not in _TRACKING_PARAMS]
+        query = '&'.join(kept)
+    return urlunparse((scheme, host, p.path or '/', p.params, query, ''))
+
+
+def _site_host(url: str) -> str:
+    host = _url_host(url)
+    return host[4:] if host.startswith('www.') else host
+
+
+class ScrapeCache:
+    """Персистентний кеш відповідей AnyCrawl з TTL за типом сторінки та LRU-витісненням за розміром."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS scrape_cache ('
+            ' url TEXT NOT NULL, engine TEXT NOT NULL, kind TEXT NOT NULL,'
+            ' payload TEXT NOT NULL, published_at TEXT, size INTEGER NOT NULL,'
+            ' created_at REAL NOT NULL, accessed_at REAL NOT NULL,'
+            ' PRIMARY KEY (url, engine))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS scrape_cache_lru ON scrape_cache (accessed_at)')
+        self._conn.commit()
+        self._total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM scrape_cache').fetchone()[0]
+
+    def get(self, url: str, kind: str, ttl_sec: int, engines: list[str] | tuple[str, ...] = ()) -> dict | None:
+        """Повертає {'engine', 'payload', 'published_at'} або None, якщо запису немає чи він протух.
+
+        Один запит і один hit/miss на URL незалежно від рушія; за кількох записів береться
+        перший рушій з engines (решта — за свіжістю).
+        """
+        key = canonical_url(url)
+        now = _time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT engine, payload, published_at, created_at, size FROM scrape_cache WHERE url=? AND kind=?',
+                (key, kind),
+            ).fetchall()
+            fresh = []
+            for r in rows:
+                if now - r[3] > ttl_sec:
+                    self._conn.execute('DELETE FROM scrape_cache WHERE url=? AND engine=?', (key, r[0]))
+                    self._total -= r[4]
+                else:
+                    fresh.append(r)
+            if len(fresh) != len(rows):
+                self._conn.commit()
+            if not fresh:
+                self.misses += 1
+                return None
+            order = {e: i for i, e in enumerate(engines)}
+            row = min(fresh, key=lambda r: (order.get(r[0], len(order)), -r[3]))
+            self._conn.execute('UPDATE scrape_cache SET accessed_at=? WHERE url=? AND engine=?', (now, key, row[0]))
+            self._conn.commit()
+            self.hits += 1
+        try:
+            return {'engine': row[0], 'payload': json.loads(row[1]), 'published_at': row[2]}
+        except ValueError:
+            return None
+
+    def put(self, url: str, engine: str, kind: str, payload: dict, published_at: str | None = None) -> None:
+        key = canonical_url(url)
+        blob = json.dumps(payload, ensure_ascii=False)
+        size = len(blob.encode('utf-8'))
+        now = _time.time()
+        try:
+            with self._lock:
+                old = self._conn.execute('SELECT size FROM scrape_cache WHERE url=? AND engine=?', (key, engine)).fetchone()
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO scrape_cache (url, engine, kind, payload, published_at, size, created_at, accessed_at)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, engine, kind, blob, published_at, size, now, now),
+                )
+                self._total += size - (old[0] if old else 0)
+                if self._total > self.max_bytes:
+                    self._evict_locked()
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f'Не вдалося записати в кеш скрапінгу ({key}): {e}')
+
+    def _evict_locked(self) -> None:
+        # Витісняємо найдавніше використані записи, поки не звільнимо ~10% запасу
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute('SELECT url, engine, size FROM scrape_cache ORDER BY accessed_at').fetchall()
+        removed = 0
+        for url, engine, size in rows:
+            if self._total <= target:
+                break
+            self._conn.execute('DELETE FROM scrape_cache WHERE url=? AND engine=?', (url, engine))
+            self._total -= size
+            removed += 1
+        logger.debug(f'Кеш скрапінгу: витіснено {removed} записів, розмір {self._total} байт')
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'bytes': self._total,
+            }
+
+
+scrape_cache = ScrapeCache(SCRAPE_CACHE_PATH, SCRAPE_CACHE_MAX_BYTES)
+
 
 def get_category_urls(category: str) -> list[str]:
     return NEWS_SOURCES.get(category, [])
 
 
-def fetch_markdown_anycrawl(url: str) -> str:
-    if not ANYCRAWL_KEY:
-        logger.error('ANYCRAWL_KEY відсутній для новин')
-        return ""
-    safe_url = requote_uri(url)
-    engines = ['cheerio', 'playwright']
-    for engine in engines:
-        try:
+# ----------------------- ANYCRAWL CLIENT -----------------------
+ANYCRAWL_API_URL = os.getenv('ANYCRAWL_API_URL', 'https://api.anycrawl.dev/v1/scrape')
+ANYCRAWL_TIMEOUT = 45
+ANYCRAWL_ENGINES = ('cheerio', 'playwright')
+
+
+class AnyCrawlClient:
+    """Клієнт AnyCrawl з пулом з'єднань, пам'яттю робочого рушія та circuit breaker на хост.
+
+    Для кожного сайту запам'ятовується рушій, що спрацював останнім, і він пробується першим.
+    Після failure_threshold поспіль невдалих скрапів сайт «вимикається» на cooldown_sec,
+    щоб не витрачати 45-секундні запити на недоступне джерело.
+    """
+
+    def __init__(self, api_key: str | None, api_url: str = ANYCRAWL_API_URL, pool_size: int = NEWS_FETCH_WORKERS,
+                 failure_threshold: int = 3, cooldown_sec: int = 300):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.failure_threshold = failure_threshold
+        self.cooldown_sec = cooldown_sec
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+        # Повтори лише для мережевих збоїв і перевантаження; 4xx і таймаути читання не повторюємо
+        retry = Retry(total=2, connect=2, read=0, status=2, backoff_factor=1.0,
+                      status_forcelist=(429, 502, 503, 504), allowed_methods=frozenset({'POST'}),
+                      respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._preferred: dict[str, str] = {}
+        self._failures: dict[str, int] = {}
+        self._open_until: dict[str, float] = {}
+
+    def engines_for(self, url: str) -> list[str]:
+        host = _url_host(url)
+        with self._lock:
+            preferred = self._preferred.get(host)
+        if not preferred:
+            return list(ANYCRAWL_ENGINES)
+        return [preferred] + [e for e in ANYCRAWL_ENGINES if e != preferred]
+
+    def is_open(self, url: str) -> bool:
+        host = _url_host(url)
+        with self._lock:
+            until = self._open_until.get(host, 0.0)
+            if until and _time.time() >= until:
+                # half-open: дозволяємо одну спробу, повторна невдача знову відкриє breaker
+                self._open_until.pop(host, None)
+                self._failures[host] = self.failure_threshold - 1
+                return False
+            return bool(until)
+
+    def _record(self, url: str, engine: str | None) -> None:
+        host = _url_host(url)
+        with self._lock:
+            if engine:
+                self._preferred[host] = engine
+                self._failures.pop(host, None)
+                return
+            fails = self._failures.get(host, 0) + 1
+            self._failures[host] = fails
+            if fails >= self.failure_threshold:
+                self._open_until[host] = _time.time() + self.cooldown_sec
+                logger.warning(f'AnyCrawl circuit breaker відкрито для {host} на {self.cooldown_sec}s після {fails} невдач')
+
+    def scrape(self, url: str, formats: tuple[str, ...] = ('markdown',)) -> tuple[str, dict] | None:
+        """Скрапить url, перебираючи рушії; повертає (engine, data) для першого непорожнього результату."""
+        if not self.api_key:
+            logger.error('ANYCRAWL_KEY відсутній для новин')
+            return None
+        if self.is_open(url):
+            logger.debug('AnyCrawl circuit breaker: пропускаємо %s', url)
+            return None
+        for engine in self.engines_for(url):
             payload = {
-                'url': safe_url,
+                'url': url,
                 'engine': engine,
-                'formats': ['markdown'],
-            }
-            headers = {
-                'Authorization': f'Bearer {ANYCRAWL_KEY}',
-                'Content-Type': 'application/json'
+                'formats': list(formats),
             }
-            resp = requests.post('https://api.anycrawl.dev/v1/scrape', headers=headers, json=payload, timeout=45)
-            logger.debug(f'News fetch {safe_url} via {engine} -> {resp.status_code}')
-            if resp.status_code != 200:
-                snippet = resp.text[:200] if resp.text else ''
-                logger.warning(f'Fetch non-200 for {safe_url} via {engine}: {resp.status_code} {snippet}')
-                continue
-            data = resp.json()
-            if data.get('success') and data.get('data', {}).get('status') == 'completed':
-                md = data['data'].get('markdown', '') or ''
-                if md.strip():
-                    return md
+            try:
+                with metrics.timed('anycrawl_request', engine=engine):
+                    resp = self.session.post(self.api_url, json=payload, timeout=ANYCRAWL_TIMEOUT)
+                logger.debug('News fetch %s via %s -> %s', url, engine, resp.status_code)
+                if resp.status_code != 200:
+                    logger.warning('Fetch non-200 for %s via %s: %s %.200s', url, engine, resp.status_code, resp.text or '')
+                    metrics.inc('anycrawl_result', engine=engine, result=f'http_{resp.status_code}')
+                    continue
+                data = resp.json()
+                if data.get('success') and data.get('data', {}).get('status') == 'completed':
+                    if any((data['data'].get(f) or '').strip() for f in formats):
+                        self._record(url, engine)
+                        metrics.inc('anycrawl_result', engine=engine, result='ok')
+                        return engine, data['data']
+                    logger.warning('Empty %s for %s via %s', '/'.join(formats), url, engine)
+                    metrics.inc('anycrawl_result', engine=engine, result='empty')
                 else:
-                    logger.warning(f'Empty markdown for {safe_url} via {engine}')
-            else:
-                logger.warning(f'Scrape not completed for {safe_url} via {engine}: {data}')
-        except Exception as e:
-            logger.error(f'Помилка fetch_markdown_anycrawl({safe_url}) via {engine}: {e}')
+                    logger.warning('Scrape not completed for %s via %s: %.300r', url, engine, data)
+                    metrics.inc('anycrawl_result', engine=engine, result='not_completed')
+            except Exception as e:
+                logger.error('Помилка AnyCrawl scrape(%s) via %s: %s', url, engine, e)
+                metrics.inc('anycrawl_result', engine=engine, result='error')
+        self._record(url, None)
+        return None
+
+
+anycrawl = AnyCrawlClient(ANYCRAWL_KEY)
+
+
+@metrics.instrument('fetch')
+def fetch_markdown_anycrawl(url: str) -> str:
+    safe_url = requote_uri(url)
+    cached = scrape_cache.get(safe_url, 'listing', LISTING_CACHE_TTL_SEC, anycrawl.engines_for(safe_url))
+    if cached:
+        return cached['payload'].get('markdown', '')
+    res = anycrawl.scrape(safe_url, formats=('markdown',))
+    if not res:
+        return ""
+    engine, data = res
+    md = data.get('markdown', '') or ''
+    scrape_cache.put(safe_url, engine, 'listing', {'markdown': md})
+    return md
+
+
+DIGEST_FAILED_TEXT = 'Не вдалося сформувати підсумок.'
+
+
+def generate_text(prompt: str, on_text=None) -> str:
+    """Виклик Gemini. З on_text — у режимі stream: on_text(накопичений текст) після кожного шматка."""
+    if on_text is None:
+        with metrics.timed('gemini_generate', mode='single'):
+            response = _genai_model().generate_content(prompt)
+            return (response.text or '').strip()
+    with metrics.timed('gemini_generate', mode='stream'):
+        return _generate_streamed(prompt, on_text)
+
+
+def _generate_streamed(prompt: str, on_text) -> str:
+    started = _time.monotonic()
+    parts: list[str] = []
+    for chunk in _genai_model().generate_content(prompt, stream=True):
+        try:
+            piece = chunk.text
+        except ValueError:
+            # шматок без тексту (наприклад, лише safety-метадані)
+            continue
+        if not piece:
             continue
-    return ""
+        if not parts:
+            logger.info(f'Gemini: перший шматок відповіді через {_time.monotonic() - started:.1f}s')
+            metrics.observe('gemini_first_chunk', _time.monotonic() - started)
+        parts.append(piece)
+        on_text(''.join(parts))
+    return ''.join(parts).strip()
 
 
-def summarize_news_with_gemini(category: str, markdown_chunks: list[str]) -> str:
+def summarize_news_with_gemini(category: str, markdown_chunks: list[str], on_text=None) -> str:
     joined = "\n\n".join(markdown_chunks)
     # Обмежуємо розмір контенту до ~20к символів для стабільності
     joined = joined[:20000]
@@ -110,222 +643,1748 @@ def summarize_news_with_gemini(category: str, markdown_chunks: list[str]) -> str
         f"Джерела (markdown нижче):\n{joined}"
     )
     try:
-        response = model.generate_content(prompt)
-        return (response.text or '').strip() or 'Не вдалося сформувати підсумок.'
+        return generate_text(prompt, on_text) or DIGEST_FAILED_TEXT
     except Exception as e:
         logger.error(f'Помилка summarize_news_with_gemini: {e}')
-        return 'Не вдалося сформувати підсумок.'
+        return DIGEST_FAILED_TEXT
+
+
+TELEGRAM_MAX_LEN = 4096
+STREAM_EDIT_INTERVAL_SEC = 1.5  # Telegram не любить частіше ~1 редагування на секунду в чаті
+
+
+def _split_point(text: str, limit: int) -> int:
+    """Де різати text довший за limit: по абзацу, рядку чи пробілу в другій половині, інакше рівно по limit."""
+    for sep in ('\n\n', '\n', ' '):
+        cut = text.rfind(sep, 0, limit)
+        if cut >= limit // 2:
+            return cut + len(sep)
+    return limit
+
+
+class TelegramStreamWriter:
+    """Показує текст, що генерується, у повідомленні Telegram, редагуючи його з обмеженою частотою.
+
+    Спершу надсилається заглушка; далі update() редагує її не частіше ніж раз на interval секунд.
+    Коли текст перевищує ліміт Telegram, заповнене повідомлення фіксується і продовження йде в нове.
+    """
+
+    def __init__(self, bot_, chat_id: int, placeholder: str = '⏳ Готую дайджест...',
+                 interval: float = STREAM_EDIT_INTERVAL_SEC, max_len: int = TELEGRAM_MAX_LEN, clock=_time.monotonic,
+                 dispatcher: 'SendDispatcher | None' = None):
+        self.bot = bot_
+        self.dispatcher = dispatcher
+        self.chat_id = chat_id
+        self.placeholder = placeholder
+        self.interval = interval
+        self.max_len = max_len
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._message_id: int | None = None
+        self._committed = ''  # текст у вже заповнених повідомленнях
+        self._shown = ''  # що зараз у поточному повідомленні
+        self._last_edit = 0.0
+
+    def _call(self, func, *args, **kwargs):
+        # Через чергу відправки, щоб редагування враховувались у лімітах чату; чекаємо результат (потрібен message_id)
+        if self.dispatcher is None:
+            return func(*args, **kwargs)
+        return self.dispatcher.submit(self.chat_id, func, *args, **kwargs).result()
+
+    def start(self) -> None:
+        msg = self._call(self.bot.send_message, self.chat_id, self.placeholder)
+        self._message_id = msg.message_id
+        self._last_edit = self.clock()
+
+    def update(self, text: str) -> None:
+        with self._lock:
+            if self.clock() - self._last_edit < self.interval:
+                return
+            self._sync(text)
+
+    def finish(self, text: str, reply_markup=None) -> None:
+        with self._lock:
+            if not text.startswith(self._committed):
+                # Фінальний текст розійшовся з уже зафіксованими повідомленнями — дописуємо його цілком
+                self._committed, self._message_id, self._shown = '', None, ''
+            self._sync(text, reply_markup)
+
+    def _sync(self, text: str, reply_markup=None) -> None:
+        current = text[len(self._committed):]
+        while len(current) > self.max_len:
+            cut = _split_point(current, self.max_len)
+            self._show(current[:cut])
+            self._committed += current[:cut]
+            current = current[cut:]
+            self._message_id, self._shown = None, ''
+        self._show(current, reply_markup)
+
+    def _show(self, chunk: str, reply_markup=None) -> None:
+        body = chunk.strip()
+        if not body or (chunk == self._shown and reply_markup is None):
+            return
+        try:
+            if self._message_id is None:
+                msg = self._call(self.bot.send_message, self.chat_id, body, reply_markup=reply_markup)
+                self._message_id = msg.message_id
+            else:
+                self._call(self.bot.edit_message_text, body, self.chat_id, self._message_id, reply_markup=reply_markup)
+        except Exception as e:
+            if 'message is not modified' not in str(e):
+                logger.warning('Stream: не вдалося оновити повідомлення: %s', e)
+        self._shown = chunk
+        self._last_edit = self.clock()
+
+
+# ----------------------- ЧЕРГА ВІДПРАВКИ В TELEGRAM -----------------------
+# Telegram: ~1 повідомлення/с в одному чаті (короткі сплески дозволені) і ~30/с на бота загалом
+SEND_CHAT_RATE = 1.0
+SEND_CHAT_BURST = 3
+SEND_GLOBAL_RATE = 25.0
+SEND_WORKERS = 4
+SEND_MAX_429_RETRIES = 3
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: float, clock=_time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+        self.paused_until = 0.0  # retry_after від Telegram
+
+    def wait_time(self) -> float:
+        """Скільки чекати до наступного токена (0 — можна відправляти)."""
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class SendDispatcher:
+    """Єдина черга вихідних викликів Telegram API.
+
+    submit() ставить виклик у чергу чату і одразу повертає Future. Воркери виконують виклики
+    в порядку надходження в межах чату (по одному одночасно на чат), дотримуючись лімітів на чат
+    і на бота; на 429 чат ставиться на паузу retry_after, а виклик повторюється.
+    """
+
+    def __init__(self, workers: int = SEND_WORKERS, chat_rate: float = SEND_CHAT_RATE, chat_burst: float = SEND_CHAT_BURST,
+                 global_rate: float = SEND_GLOBAL_RATE, clock=_time.monotonic):
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._queues: 'OrderedDict[int, deque]' = OrderedDict()
+        self._buckets: dict[int, _TokenBucket] = {}
+        self._busy: set[int] = set()
+        self._global = _TokenBucket(global_rate, global_rate, clock)
+        self._threads: list[threading.Thread] = []
+        self.stats = {'sent': 0, 'failed': 0, 'rate_limited': 0}
+
+    def submit(self, chat_id: int, func, *args, **kwargs) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            self._ensure_started_locked()
+            self._queues.setdefault(chat_id, deque()).append((func, args, kwargs, fut, 0))
+            self._cond.notify()
+        return fut
+
+    def send_message(self, chat_id: int, text: str, **kwargs) -> Future:
+        return self.submit(chat_id, bot.send_message, chat_id, text, **kwargs)
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+    def _ensure_started_locked(self) -> None:
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f'tg-send-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _next_locked(self):
+        """Перший чат з чергою, що не зайнятий і має токен; інакше — скільки почекати."""
+        delay = None
+        for chat_id, queue in self._queues.items():
+            if chat_id in self._busy or not queue:
+                continue
+            bucket = self._buckets.setdefault(chat_id, _TokenBucket(self.chat_rate, self.chat_burst, self.clock))
+            wait_sec = max(bucket.wait_time(), self._global.wait_time())
+            if wait_sec <= 0:
+                bucket.take()
+                self._global.take()
+                self._busy.add(chat_id)
+                # Чат іде в кінець — інші чати не чекають на довгу серію повідомлень
+                self._queues.move_to_end(chat_id)
+                return chat_id, queue.popleft(), None
+            delay = wait_sec if delay is None else min(delay, wait_sec)
+        return None, None, delay
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                chat_id, item, delay = self._next_locked()
+                while item is None:
+                    self._cond.wait(timeout=delay)
+                    chat_id, item, delay = self._next_locked()
+            func, args, kwargs, fut, attempt = item
+            retry_after = None
+            try:
+                result = func(*args, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code == 429 and attempt < SEND_MAX_429_RETRIES:
+                    retry_after = int((e.result_json.get('parameters') or {}).get('retry_after', 1))
+                    logger.warning('Telegram 429 для чату %s: пауза %ss (спроба %s)', chat_id, retry_after, attempt + 1)
+                else:
+                    self._fail(fut, e)
+            except Exception as e:
+                self._fail(fut, e)
+            else:
+                self.stats['sent'] += 1
+                fut.set_result(result)
+            with self._cond:
+                self._busy.discard(chat_id)
+                if retry_after is not None:
+                    self.stats['rate_limited'] += 1
+                    self._buckets[chat_id].paused_until = self.clock() + retry_after
+                    self._queues[chat_id].appendleft((func, args, kwargs, fut, attempt + 1))
+                elif not self._queues[chat_id]:
+                    del self._queues[chat_id]
+                self._prune_buckets_locked()
+                self._cond.notify_all()
+
+    def _prune_buckets_locked(self) -> None:
+        # Ліміт чату пам'ятаємо, доки відро не наповниться знову, інакше нова серія обійшла б його
+        for chat_id in [c for c in self._buckets if c not in self._queues and c not in self._busy]:
+            bucket = self._buckets[chat_id]
+            if bucket.wait_time() <= 0 and bucket.tokens >= bucket.burst:
+                del self._buckets[chat_id]
+
+    def _fail(self, fut: Future, e: Exception) -> None:
+        self.stats['failed'] += 1
+        logger.warning('Не вдалося виконати виклик Telegram: %s', e)
+        fut.set_exception(e)
+
+
+send_dispatcher = SendDispatcher()
+
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_LEN) -> list[str]:
+    """Ділить текст на частини до limit символів по абзацах/рядках/пробілах."""
+    parts = []
+    while len(text) > limit:
+        cut = _split_point(text, limit)
+        parts.append(text[:cut])
+        text = text[cut:]
+    parts.append(text)
+    return [p for p in parts if p.strip()] or [text]
+
+
+def send_message(chat_id: int, text: str, **kwargs) -> Future:
+    """Ставить повідомлення в чергу відправки і одразу повертає керування."""
+    return send_dispatcher.send_message(chat_id, text, **kwargs)
+
+
+def reply_to(message, text: str, **kwargs) -> Future:
+    return send_dispatcher.submit(message.chat.id, bot.reply_to, message, text, **kwargs)
+
+
+def send_long_text(chat_id: int, text: str, reply_markup=None) -> list[Future]:
+    parts = split_message(text)
+    return [send_message(chat_id, part, reply_markup=reply_markup if i == len(parts) - 1 else None)
+            for i, part in enumerate(parts)]
+
+
+# ----------------------- ДОВГІ ЗАВДАННЯ (JOB EXECUTOR) -----------------------
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '3'))
+JOB_MAX_PENDING = 20
+JOB_PROGRESS_AFTER_SEC = 20
+JOB_PROGRESS_EVERY_SEC = 60
+
+
+class JobExecutor:
+    """Окремий обмежений пул для довгих дій (дайджест, пошта, таблиця), щоб не займати потоки обробки апдейтів.
+
+    Одна дія на чат виконується лише раз: повторне натискання поки завдання в черзі чи працює
+    повертає 'duplicate'. Довгим завданням періодично надсилається «ще працюю».
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING,
+                 progress_after: float = JOB_PROGRESS_AFTER_SEC, progress_every: float = JOB_PROGRESS_EVERY_SEC):
+        self.max_pending = max_pending
+        self.progress_after = progress_after
+        self.progress_every = progress_every
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._jobs: dict[tuple[int, str], dict] = {}
+        self._durations: dict[str, dict] = {}
+        self._monitor: threading.Thread | None = None
+
+    def submit(self, chat_id: int, action: str, label: str, fn, *args) -> str:
+        """'started' | 'duplicate' (така сама дія вже виконується) | 'busy' (черга переповнена)."""
+        key = (chat_id, action)
+        with self._lock:
+            if key in self._jobs:
+                return 'duplicate'
+            if len(self._jobs) >= self.max_pending:
+                logger.warning(f'Job: черга переповнена ({len(self._jobs)}), відхиляю {action}')
+                return 'busy'
+            job = {'label': label, 'queued_at': _time.monotonic(), 'started_at': None, 'next_progress': None}
+            self._jobs[key] = job
+            self._ensure_monitor_locked()
+        self._pool.submit(self._run, key, job, fn, args)
+        return 'started'
+
+    def _run(self, key: tuple[int, str], job: dict, fn, args) -> None:
+        chat_id, action = key
+        started = _time.monotonic()
+        with self._lock:
+            job['started_at'] = started
+            job['next_progress'] = started + self.progress_after
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error(f'Job {action} для чату {chat_id} завершився помилкою: {e}')
+            send_message(chat_id, f'Не вдалося виконати: {job["label"]}.')
+        finally:
+            took = _time.monotonic() - started
+            with self._lock:
+                self._jobs.pop(key, None)
+                d = self._durations.setdefault(action.split(':', 1)[0], {'count': 0, 'total': 0.0, 'max': 0.0})
+                d['count'] += 1
+                d['total'] += took
+                d['max'] = max(d['max'], took)
+                depth = len(self._jobs)
+            metrics.observe('job', took, action=action.split(':', 1)[0])
+            metrics.observe('job_wait', started - job['queued_at'], action=action.split(':', 1)[0])
+            logger.info(f'Job {action}: {took:.1f}s (очікування {started - job["queued_at"]:.1f}s), у черзі/роботі {depth}')
+
+    def _ensure_monitor_locked(self) -> None:
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._progress_loop, name='job-progress', daemon=True)
+            self._monitor.start()
+
+    def _progress_loop(self) -> None:
+        while True:
+            _time.sleep(5)
+            now = _time.monotonic()
+            due = []
+            with self._lock:
+                for (chat_id, _action), job in self._jobs.items():
+                    if job['next_progress'] is not None and now >= job['next_progress']:
+                        job['next_progress'] = now + self.progress_every
+                        due.append((chat_id, job['label'], now - job['started_at']))
+            for chat_id, label, elapsed in due:
+                send_message(chat_id, f'⏳ Ще працюю: {label} ({int(elapsed)}s)…')
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j['started_at'] is not None)
+            return {
+                'queued': len(self._jobs) - running,
+                'running': running,
+                'durations': {a: {'count': d['count'], 'avg': round(d['total'] / d['count'], 2), 'max': round(d['max'], 2)}
+                              for a, d in self._durations.items()},
+            }
 
 
-def send_long_text(chat_id: int, text: str) -> None:
-    import time
-    max_len = 4096
-    if len(text) <= max_len:
-        bot.send_message(chat_id, text)
-        return
-    parts = [text[i:i+max_len] for i in range(0, len(text), max_len)]
-    for part in parts:
-        bot.send_message(chat_id, part)
-        time.sleep(1)
-
-
-def extract_recent_articles_markdown(markdown_page: str, base_url: str) -> list[dict]:
-    # Якщо AnyCrawl віддав markdown розділу, спробуємо вилучити посилання
-    # Простий хак: витягнемо рядки з форматованими посиланнями [текст](url)
-    import re
-    links = re.findall(r"\[([^\]]+)\]\((https?://[^\)]+)\)", markdown_page)
-    articles = []
-    for title, url in links:
-        articles.append({"title": title.strip(), "url": url.strip()})
+job_executor = JobExecutor()
+
+JOB_REPLIES = {
+    'duplicate': 'Вже виконується, зачекайте…',
+    'busy': 'Забагато запитів, спробуйте трохи пізніше',
+}
+
+
+# Посилання з markdown: [текст](url "title"), крім зображень ![alt](src)
+_MD_LINK_RE = re.compile(r'(?<!!)\[([^\]]+)\]\((https?://[^\s)]+)')
+_NON_ARTICLE_SEGMENTS = {
+    'tag', 'tags', 'category', 'categories', 'rubric', 'author', 'authors', 'page', 'search',
+    'login', 'register', 'signup', 'subscribe', 'subscription', 'about', 'contacts', 'contact',
+    'privacy', 'terms', 'rss', 'feed', 'advertising', 'reklama', 'live', 'podcasts',
+}
+_NON_ARTICLE_EXT = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.pdf', '.mp4', '.mp3', '.xml', '.rss', '.zip')
+
+
+def _is_article_link(url: str, site: str, listing_path: str, require_slug: bool = True) -> bool:
+    """Евристика «схоже на статтю цього ж сайту»: той самий домен, не службовий розділ, slug з цифрами,
+    дефісами чи підкресленнями. require_slug=False лишає тільки перевірки домену і розділу."""
+    host = _site_host(url)
+    if not (host == site or host.endswith('.' + site) or site.endswith('.' + host)):
+        return False
+    path = urlparse(url).path
+    if path.rstrip('/') in ('', listing_path.rstrip('/')) or path.lower().endswith(_NON_ARTICLE_EXT):
+        return False
+    segments = [seg for seg in path.lower().split('/') if seg]
+    if any(seg in _NON_ARTICLE_SEGMENTS for seg in segments):
+        return False
+    if not require_slug:
+        return True
+    slug = segments[-1]
+    return any(ch.isdigit() for ch in path) or slug.count('-') + slug.count('_') >= 2
+
+
+def extract_recent_articles_markdown(markdown_page: str, base_url: str, stats: dict | None = None) -> list[dict]:
+    """Посилання на статті зі сторінки-списку: лише той самий сайт, без навігації, канонічні і без дублікатів.
+
+    Якщо евристика slug відкинула всі посилання непорожньої сторінки, беремо просто посилання
+    цього сайту поза службовими розділами — інакше джерело мовчки не давало б жодної статті.
+    """
+    links = _MD_LINK_RE.findall(markdown_page or '')
+    site = _site_host(base_url)
+    listing_path = urlparse(base_url).path
+
+    def select(require_slug: bool) -> list[dict]:
+        seen: set[tuple] = set()
+        found = []
+        for title, url in links:
+            url = canonical_url(url)
+            # www.site і site вважаємо одним посиланням
+            p = urlparse(url)
+            dedup_key = (_site_host(url), p.path.rstrip('/'), p.query)
+            if dedup_key in seen or not _is_article_link(url, site, listing_path, require_slug):
+                continue
+            seen.add(dedup_key)
+            found.append({"title": title.strip(), "url": url})
+        return found
+
+    articles = select(require_slug=True)
+    if not articles and links:
+        articles = select(require_slug=False)
+        logger.warning(f'{base_url}: жодне з {len(links)} посилань не схоже на статтю за slug; '
+                       f'беремо {len(articles)} посилань цього сайту')
+    if stats is not None:
+        stats['links'] = len(links)
+        stats['candidates'] = len(articles)
     return articles
 
 
-def fetch_article_if_recent(url: str, hours: int = 24) -> dict | None:
-    """Завантажує сторінку статті, намагається розпізнати дату публікації; якщо свіжа — повертає dict."""
+class ArticleIndex:
+    """Довгоживучий індекс уже завантажених статей: канонічний URL → дата публікації.
+
+    Дозволяє відкинути відомі застарілі посилання ще до планування запиту до AnyCrawl;
+    живе довше за кеш скрапінгу, бо зберігає лише URL і дату.
+    """
+
+    RETENTION_SEC = 30 * 86400
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS article_index (url TEXT PRIMARY KEY, published_at TEXT, fetched_at REAL NOT NULL)')
+        self._conn.execute('DELETE FROM article_index WHERE fetched_at < ?', (_time.time() - self.RETENTION_SEC,))
+        self._conn.commit()
+
+    def record(self, url: str, published_at: str | None) -> None:
+        try:
+            with self._lock:
+                self._conn.execute('INSERT OR REPLACE INTO article_index (url, published_at, fetched_at) VALUES (?, ?, ?)',
+                                   (canonical_url(url), published_at, _time.time()))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f'Не вдалося записати в індекс статей ({url}): {e}')
+
+    def known_stale(self, urls: list[str], hours: int) -> set[str]:
+        """Підмножина urls (канонічних), про які відомо, що вони старші за вікно hours."""
+        if not urls:
+            return set()
+        with self._lock:
+            placeholders = ','.join('?' * len(urls))
+            rows = self._conn.execute(
+                f'SELECT url, published_at FROM article_index WHERE published_at IS NOT NULL AND url IN ({placeholders})',
+                list(urls),
+            ).fetchall()
+        return {url for url, published_at in rows if _is_stale(published_at, hours)}
+
+
+article_index = ArticleIndex(SCRAPE_CACHE_PATH)
+
+
+# ----------------------- ДАТА ПУБЛІКАЦІЇ -----------------------
+# Рівні від дешевого до дорогого: регулярки по <head> (JSON-LD, meta) → обмежений прохід по <time>
+# → dateparser лише для неструктурованих рядків. Повний DOM не будується.
+HTML_SCAN_LIMIT = 300_000  # далі цього в HTML дату не шукаємо
+TIME_TAG_SCAN_LIMIT = 10
+MD_DATE_SCAN_CHARS = 2000
+MD_DATE_MAX_LINES = 8
+
+_HEAD_END_RE = re.compile(r'</head\s*>', re.I)
+_JSONLD_DATE_RE = re.compile(r'"datePublished"\s*:\s*"([^"]{8,40})"')
+_META_TAG_RE = re.compile(r'<meta\b[^>]*>', re.I)
+_TAG_ATTR_RE = re.compile(r'([a-zA-Z_:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+_TIME_TAG_RE = re.compile(r'<time\b([^>]*)>(.*?)</time\s*>', re.I | re.S)
+_STRIP_TAGS_RE = re.compile(r'<[^>]+>')
+_MD_DATE_HINT_RE = re.compile(
+    r'\d{4}-\d{2}-\d{2}|\b\d{1,2}[./]\d{1,2}[./]\d{2,4}\b|\b\d{1,2}:\d{2}\b'
+    r'|\b(?:сьогодні|вчора|today|yesterday)\b|\b(?:тому|ago)\b',
+    re.I,
+)
+_META_DATE_KEYS = {
+    'article:published_time', 'og:published_time', 'datepublished', 'pubdate', 'publishdate',
+    'publish-date', 'date', 'dc.date', 'dc.date.issued', 'sailthru.date', 'parsely-pub-date',
+}
+
+_date_parser = None
+_date_parser_lock = threading.Lock()
+
+
+def _tag_attrs(raw: str) -> dict[str, str]:
+    return {k.lower(): (v1 if v1 else v2) for k, v1, v2 in _TAG_ATTR_RE.findall(raw)}
+
+
+def _parse_iso_datetime(value: str) -> datetime | None:
+    v = value.strip()
+    if v.endswith('Z'):
+        v = v[:-1] + '+00:00'
     try:
-        payload = {
-            'url': url,
-            'engine': 'cheerio',
-            'formats': ['html', 'markdown']
-        }
-        headers = {
-            'Authorization': f'Bearer {ANYCRAWL_KEY}',
-            'Content-Type': 'application/json'
-        }
-        resp = requests.post('https://api.anycrawl.dev/v1/scrape', headers=headers, json=payload, timeout=45)
-        if resp.status_code != 200:
-            return None
-        data = resp.json()
-        if not (data.get('success') and data.get('data', {}).get('status') == 'completed'):
-            return None
-        html = data['data'].get('html') or ''
-        md = data['data'].get('markdown') or ''
-        if not html and not md:
-            return None
-        # Парсимо HTML для пошуку дати
+        dt = datetime.fromisoformat(v)
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _parse_fuzzy_datetime(value: str) -> datetime | None:
+    """Останній рівень: dateparser з одним спільним DateDataParser замість налаштувань на кожен виклик."""
+    global _date_parser
+    if _date_parser is None:
+        with _date_parser_lock:
+            if _date_parser is None:
+                from dateparser.date import DateDataParser
+                # Джерела переважно українські: 12.05.2024 — це 12 травня
+                _date_parser = DateDataParser(settings={'TIMEZONE': 'UTC', 'RETURN_AS_TIMEZONE_AWARE': False,
+                                                        'DATE_ORDER': 'DMY', 'PREFER_DATES_FROM': 'past'})
+    data = _date_parser.get_date_data(value.strip()[:100])
+    return data.date_obj if data else None
+
+
+def extract_published_at(html: str, md: str = '') -> datetime | None:
+    """Дата публікації статті (naive UTC) з HTML і markdown або None."""
+    fuzzy: list[str] = []
+    if html:
+        head_end = _HEAD_END_RE.search(html, 0, HTML_SCAN_LIMIT)
+        head = html[:head_end.start()] if head_end else html[:HTML_SCAN_LIMIT]
+        # 1. JSON-LD datePublished та OpenGraph/article meta у <head>
+        m = _JSONLD_DATE_RE.search(head)
+        if m and (dt := _parse_iso_datetime(m.group(1))):
+            return dt
+        for tag in _META_TAG_RE.findall(head):
+            attrs = _tag_attrs(tag)
+            key = (attrs.get('property') or attrs.get('name') or attrs.get('itemprop') or '').lower()
+            content = attrs.get('content')
+            if key in _META_DATE_KEYS and content:
+                if dt := _parse_iso_datetime(content):
+                    return dt
+                fuzzy.append(content)
+        # JSON-LD часто лежить у <body>
+        if head_end and (m := _JSONLD_DATE_RE.search(html, head_end.end(), HTML_SCAN_LIMIT)):
+            if dt := _parse_iso_datetime(m.group(1)):
+                return dt
+        # 2. Перші кілька <time>
+        for i, m in enumerate(_TIME_TAG_RE.finditer(html, 0, HTML_SCAN_LIMIT)):
+            if i >= TIME_TAG_SCAN_LIMIT:
+                break
+            value = _tag_attrs(m.group(1)).get('datetime')
+            if value and (dt := _parse_iso_datetime(value)):
+                return dt
+            text = _STRIP_TAGS_RE.sub(' ', value or m.group(2)).strip()
+            if text:
+                fuzzy.append(text)
+    # 3. dateparser: неструктуровані значення, потім схожі на дату рядки з початку markdown
+    if md:
+        lines = [ln.strip() for ln in md[:MD_DATE_SCAN_CHARS].splitlines()]
+        fuzzy.extend(ln for ln in lines if len(ln) <= 80 and _MD_DATE_HINT_RE.search(ln))
+    for value in fuzzy[:TIME_TAG_SCAN_LIMIT + MD_DATE_MAX_LINES]:
+        if dt := _parse_fuzzy_datetime(value):
+            return dt
+    return None
+
+
+def _is_stale(published_at: str | None, hours: int) -> bool:
+    if not published_at:
+        return False
+    try:
+        return (datetime.utcnow() - datetime.fromisoformat(published_at)) > timedelta(hours=hours)
+    except ValueError:
+        return False
+
+
+def _scrape_article(url: str) -> dict | None:
+    """Скрапить статтю через AnyCrawl і повертає {'engine', 'title', 'markdown', 'published_at'} без фільтра за давністю."""
+    res = anycrawl.scrape(url, formats=('html', 'markdown'))
+    if not res:
+        return None
+    engine, data = res
+    html = data.get('html') or ''
+    md = data.get('markdown') or ''
+    try:
+        pub_dt = extract_published_at(html, md)
+    except Exception:
+        # Якщо не змогли визначити дату, вважаємо статтю потенційно новою і включаємо
         pub_dt = None
-        try:
-            soup = BeautifulSoup(html, 'html.parser')
-            # типові місця для дат
-            candidates = []
-            candidates.extend([t.get('datetime') for t in soup.find_all('time') if t.get('datetime')])
-            candidates.extend([t.text for t in soup.find_all('time') if t.text])
-            for sel in ['meta[property="article:published_time"]', 'meta[name="article:published_time"]', 'meta[name="pubdate"]', 'meta[name="date"]']:
-                m = soup.select_one(sel)
-                if m and m.get('content'):
-                    candidates.append(m['content'])
-            # розпізнаємо перший валідний час
-            now = datetime.utcnow()
-            for c in candidates:
-                dt = dateparser.parse(c, settings={'TIMEZONE': 'UTC', 'RETURN_AS_TIMEZONE_AWARE': False})
-                if dt:
-                    pub_dt = dt
-                    break
-            # якщо не знайшли дату — спробуємо з markdown (часто містить дату як текст)
-            if not pub_dt and md:
-                dt = dateparser.parse(md[:2000], settings={'TIMEZONE': 'UTC', 'RETURN_AS_TIMEZONE_AWARE': False})
-                if dt:
-                    pub_dt = dt
-            # фільтр за давністю
-            if pub_dt and (now - pub_dt) > timedelta(hours=hours):
-                return None
-        except Exception:
-            # Якщо не змогли визначити дату, вважаємо статтю потенційно новою і включаємо
-            pub_dt = None
+    title = None
+    if md:
+        # заголовок з першого рядка markdown, якщо є
+        first_line = md.strip().splitlines()[0]
+        if len(first_line) < 160:
+            title = first_line.strip('# ').strip()
+    return {
+        'engine': engine,
+        'title': title,
+        'markdown': md[:4000],
+        'published_at': pub_dt.isoformat() if pub_dt else None,
+    }
+
+
+def fetch_article_if_recent(url: str, hours: int = 24) -> dict | None:
+    """Завантажує сторінку статті, намагається розпізнати дату публікації; якщо свіжа — повертає dict.
+
+    Розібрані статті (разом з датою публікації) кешуються на диску, тож повторний запит
+    або відсів застарілої статті не потребує звернення до AnyCrawl.
+    """
+    return fetch_article_checked(url, hours)[1]
+
+
+@metrics.instrument('fetch')
+def fetch_article_checked(url: str, hours: int = 24) -> tuple[str, dict | None]:
+    """Як fetch_article_if_recent, але з причиною: ('fresh', dict), ('stale', None) або ('error', None)."""
+    try:
+        art = None
+        cached = scrape_cache.get(url, 'article', ARTICLE_CACHE_TTL_SEC, anycrawl.engines_for(url))
+        if cached:
+            art = dict(cached['payload'], published_at=cached['published_at'])
+        if art is None:
+            art = _scrape_article(url)
+            if not art:
+                return 'error', None
+            scrape_cache.put(url, art['engine'], 'article',
+                             {'title': art['title'], 'markdown': art['markdown']}, art['published_at'])
+            article_index.record(url, art['published_at'])
+        # фільтр за давністю
+        if _is_stale(art['published_at'], hours):
+            return 'stale', None
         # Формуємо об'єкт статті
-        title = None
-        if md:
-            # заголовок з першого рядка markdown, якщо є
-            first_line = md.strip().splitlines()[0]
-            if len(first_line) < 160:
-                title = first_line.strip('# ').strip()
-        return {
+        return 'fresh', {
             'url': url,
-            'title': title or url,
-            'published_at': pub_dt.isoformat() if pub_dt else None,
-            'markdown': md[:4000]
+            'title': art['title'] or url,
+            'published_at': art['published_at'],
+            'markdown': art['markdown']
         }
     except Exception:
-        return None
+        return 'error', None
+
+
+# ----------------------- ПАРАЛЕЛЬНИЙ ЗБІР НОВИН -----------------------
+NEWS_LINKS_PER_SOURCE = 20  # не більше 20 посилань зі списку
+_news_collect_cfg = _cfg.get('news_collect', {})
+# Загальний бюджет часу на дайджест; збір зупиняється раніше, лишаючи запас на Gemini
+NEWS_TIME_BUDGET_SEC = float(_news_collect_cfg.get('time_budget_seconds', 120))
+NEWS_GEMINI_RESERVE_SEC = float(_news_collect_cfg.get('gemini_reserve_seconds', 30))
+# Списки йдуть від нових до старих: K застарілих статей поспіль — далі свіжих уже не буде
+NEWS_STALE_STREAK = int(_news_collect_cfg.get('stale_streak', 4))
+
+_fetch_pool = ThreadPoolExecutor(max_workers=NEWS_FETCH_WORKERS, thread_name_prefix='news-fetch')
+_host_inflight: dict[str, int] = {}
+_host_inflight_lock = threading.Lock()
+
+
+def _try_acquire_host(host: str) -> bool:
+    with _host_inflight_lock:
+        if _host_inflight.get(host, 0) >= NEWS_FETCH_PER_HOST:
+            return False
+        _host_inflight[host] = _host_inflight.get(host, 0) + 1
+        return True
+
+
+def _release_host(host: str) -> None:
+    with _host_inflight_lock:
+        left = _host_inflight.get(host, 1) - 1
+        if left > 0:
+            _host_inflight[host] = left
+        else:
+            _host_inflight.pop(host, None)
+
+
+class _SourceState:
+    """Стан збору одного джерела: список посилань, отримані статті та курсор детермінованого порядку."""
+
+    def __init__(self, listing_url: str):
+        self.listing_url = listing_url
+        self.listing_host = _url_host(listing_url)
+        self.listing_submitted = False
+        self.links: list[dict] | None = None
+        self.next_idx = 0  # наступне посилання, яке ще не відправлене в пул
+        self.scan_idx = 0  # до цього індексу результати вже переглянуті по порядку
+        self.results: dict[int, tuple[str, dict | None]] = {}
+        self.articles: list[dict] = []
+        self.stale_streak = 0
+        self.cut_short = False
+        self.answered = False  # джерело справді відповіло: список порожній або хоч одна стаття без помилки
+        self.done = False
+        self.stats = {'links': 0, 'candidates': 0, 'skipped_stale': 0, 'fetched': 0}
+
+
+def collect_recent_news(listing_urls: list[str], hours: int = 24, max_items: int = 5,
+                        deadline: float | None = None, report: dict | None = None) -> tuple[list[list[dict]], list[str]]:
+    """Збирає свіжі статті з усіх джерел паралельно.
+
+    Списки та статті всіх джерел тягнуться одночасно в спільному пулі з глобальним лімітом
+    і лімітом на хост. Для кожного джерела повертаються перші max_items свіжих статей у порядку
+    посилань на сторінці-списку — так само, як при послідовному обході, незалежно від того,
+    в якому порядку завершились запити. Джерело зупиняється після NEWS_STALE_STREAK застарілих
+    статей поспіль. Якщо настав deadline (time.monotonic()), повертається зібране на цей момент.
+
+    Повертає (статті по джерелах, listing-URL джерел, які не встигли дочитати). У report, якщо передано,
+    записується 'answered' — скільки джерел справді відповіли (список завантажено і або він порожній,
+    або хоч одна стаття отримана без помилки); 0 означає збій збору, а не відсутність новин.
+    """
+    states = [_SourceState(u) for u in listing_urls]
+    pending: dict[Future, tuple[_SourceState, int]] = {}
+
+    def submit(state: _SourceState, host: str, idx: int, fn, *args) -> None:
+        fut = _fetch_pool.submit(fn, *args)
+        fut.add_done_callback(lambda _f, h=host: _release_host(h))
+        pending[fut] = (state, idx)
+
+    def pump() -> None:
+        # По одному завданню на джерело за прохід, щоб джерела просувались рівномірно
+        progressed = True
+        while progressed and len(pending) < NEWS_FETCH_WORKERS:
+            progressed = False
+            for st in states:
+                if st.done or len(pending) >= NEWS_FETCH_WORKERS:
+                    continue
+                if not st.listing_submitted:
+                    if _try_acquire_host(st.listing_host):
+                        st.listing_submitted = True
+                        submit(st, st.listing_host, -1, fetch_markdown_anycrawl, st.listing_url)
+                        progressed = True
+                    continue
+                if st.links is None or st.next_idx >= len(st.links):
+                    continue
+                url = st.links[st.next_idx]['url']
+                host = _url_host(url)
+                if _try_acquire_host(host):
+                    submit(st, host, st.next_idx, fetch_article_checked, url, hours)
+                    st.next_idx += 1
+                    st.stats['fetched'] += 1
+                    progressed = True
+
+    def finish(st: _SourceState) -> None:
+        if not st.done:
+            logger.info(f'Джерело {st.listing_url}: {st.stats}, свіжих {len(st.articles)}')
+        st.done = True
+        for fut, (owner, _) in list(pending.items()):
+            if owner is st:
+                fut.cancel()  # ще не стартовані запити знімаємо; вже запущені просто ігноруємо
+                pending.pop(fut, None)
+
+    def advance(st: _SourceState) -> None:
+        while st.scan_idx in st.results:
+            status, art = st.results.pop(st.scan_idx)
+            st.scan_idx += 1
+            if status == 'stale':
+                st.stale_streak += 1
+                if st.stale_streak >= NEWS_STALE_STREAK:
+                    logger.debug('Джерело %s: %s застарілих поспіль, зупиняємось', st.listing_url, st.stale_streak)
+                    finish(st)
+                    return
+            elif art:
+                st.stale_streak = 0
+                st.articles.append(art)
+                if len(st.articles) >= max_items:
+                    finish(st)
+                    return
+        if st.links is not None and st.scan_idx >= len(st.links):
+            finish(st)
+
+    def expire() -> None:
+        # Бюджет вичерпано: беремо вже отримані свіжі статті (і ті, що прийшли не по черзі)
+        for st in states:
+            if st.done:
+                continue
+            extra = [art for _, (status, art) in sorted(st.results.items()) if art]
+            st.articles.extend(extra[:max(0, max_items - len(st.articles))])
+            st.cut_short = True
+            finish(st)
+
+    while True:
+        pump()
+        remaining = None if deadline is None else deadline - _time.monotonic()
+        if remaining is not None and remaining <= 0:
+            expire()
+            break
+        if not pending:
+            if all(st.done for st in states):
+                break
+            # Слоти хостів зайняті іншими зборами — чекаємо, поки звільняться
+            _time.sleep(0.05)
+            continue
+        finished, _ = wait(list(pending), timeout=remaining, return_when=FIRST_COMPLETED)
+        for fut in finished:
+            if fut not in pending:
+                continue
+            st, idx = pending.pop(fut)
+            try:
+                res = fut.result()
+            except Exception as e:
+                logger.error(f'Помилка паралельного збору ({st.listing_url}): {e}')
+                res = None
+            if idx < 0:
+                if not res:
+                    finish(st)
+                    continue
+                links = extract_recent_articles_markdown(res, st.listing_url, st.stats)
+                # Відомі застарілі статті відкидаємо без запиту до AnyCrawl
+                stale = article_index.known_stale([it['url'] for it in links], hours)
+                st.stats['skipped_stale'] = sum(1 for it in links if it['url'] in stale)
+                st.links = [it for it in links if it['url'] not in stale][:NEWS_LINKS_PER_SOURCE]
+                if not st.links:
+                    st.answered = True
+                advance(st)
+            elif not st.done:
+                st.results[idx] = res if res else ('error', None)
+                if st.results[idx][0] != 'error':
+                    st.answered = True
+                advance(st)
+    if report is not None:
+        report['answered'] = sum(1 for st in states if st.answered)
+    return [st.articles for st in states], [st.listing_url for st in states if st.cut_short]
 
 
 def collect_recent_news_from_source(listing_url: str, hours: int = 24, max_items: int = 5) -> list[dict]:
     # Завантажуємо розділ-список, витягаємо посилання на статті, тягнемо кожну і фільтруємо за часом
-    listing_md = fetch_markdown_anycrawl(listing_url)
-    if not listing_md:
-        return []
-    items = extract_recent_articles_markdown(listing_md, listing_url)
-    results = []
-    for it in items[:20]:  # не більше 20 посилань зі списку
-        art = fetch_article_if_recent(it['url'], hours=hours)
-        if art:
-            results.append(art)
-            if len(results) >= max_items:
-                break
-    return results
+    return collect_recent_news([listing_url], hours=hours, max_items=max_items)[0][0]
+
+
+# ----------------------- КЕШ ДАЙДЖЕСТІВ + SINGLE-FLIGHT -----------------------
+DIGEST_CACHE_MAX_ENTRIES = 64
+
+
+class SingleFlight:
+    """Об'єднує одночасні виклики з однаковим ключем в одне спільне обчислення."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error: BaseException | None = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+
+    def do(self, key, fn) -> tuple[object, bool]:
+        """Повертає (результат, shared); shared=True, якщо результат отримано з чужого обчислення."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+
+_digest_flight = SingleFlight()
+_digest_cache: 'OrderedDict[str, str]' = OrderedDict()
+_digest_cache_lock = threading.Lock()
+_digest_stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+
+
+def _bump_digest_stat(name: str) -> None:
+    with _digest_cache_lock:
+        _digest_stats[name] += 1
+
+
+def _articles_fingerprint(category: str, articles: list[dict]) -> str:
+    h = hashlib.sha256(category.encode('utf-8'))
+    for a in articles:
+        h.update(b'\x00')
+        h.update(a['url'].encode('utf-8'))
+        h.update(b'\x00')
+        h.update((a.get('markdown') or '').encode('utf-8'))
+    return f'{category}:{h.hexdigest()}'
+
+
+def _digest_cache_get(key: str) -> str | None:
+    with _digest_cache_lock:
+        text = _digest_cache.get(key)
+        if text is not None:
+            _digest_cache.move_to_end(key)
+        return text
+
+
+def _digest_cache_put(key: str, text: str) -> None:
+    with _digest_cache_lock:
+        _digest_cache[key] = text
+        _digest_cache.move_to_end(key)
+        while len(_digest_cache) > DIGEST_CACHE_MAX_ENTRIES:
+            _digest_cache.popitem(last=False)
+
+
+def summarize_category_recent(category: str, urls: list[str], hours: int = 24, on_text=None) -> str:
+    """Дайджест категорії; одночасні запити тієї ж категорії чекають на одне спільне обчислення.
+
+    on_text отримує текст, що генерується, лише в того виклику, який справді рахує дайджест.
+    """
+    text, shared = _digest_flight.do((category, tuple(urls), hours),
+                                     lambda: _summarize_category_recent(category, urls, hours, on_text))
+    if shared:
+        _bump_digest_stat('coalesced')
+        logger.info(f'Дайджест {category}: приєднались до вже запущеного обчислення; статистика {_digest_stats}')
+    return text
+
+
+def _cut_short_note(cut_short: list[str]) -> str:
+    if not cut_short:
+        return ''
+    hosts = ', '.join(_site_host(u) for u in cut_short)
+    return f'\n\n⚠️ Не встигли повністю переглянути джерела (ліміт часу): {hosts}'
 
 
-def summarize_category_recent(category: str, urls: list[str], hours: int = 24) -> str:
+def _summarize_category_recent(category: str, urls: list[str], hours: int, on_text=None) -> str:
+    started = _time.monotonic()
+    deadline = started + max(NEWS_TIME_BUDGET_SEC - NEWS_GEMINI_RESERVE_SEC, 1.0)
+    # Map і підрахунок токенів ділять резерв Gemini з reduce: reduce лишається щонайменше половина
+    map_deadline = started + max(NEWS_TIME_BUDGET_SEC - NEWS_GEMINI_RESERVE_SEC / 2, 1.0)
+    report: dict = {}
+    per_source, cut_short = collect_recent_news(urls, hours=hours, max_items=5, deadline=deadline, report=report)
     all_articles = []
-    for u in urls:
-        all_articles.extend(collect_recent_news_from_source(u, hours=hours, max_items=5))
+    for articles in per_source:
+        all_articles.extend(articles)
+    logger.info(f'Кеш скрапінгу після збору {category}: {scrape_cache.stats()}')
+    if cut_short:
+        logger.warning(f'Дайджест {category}: бюджет {NEWS_TIME_BUDGET_SEC:.0f}s вичерпано, неповні джерела: {cut_short}')
+    note = _cut_short_note(cut_short)
+    if not all_articles and not report.get('answered'):
+        # Жодне джерело не відповіло (AnyCrawl недоступний, запобіжники, ліміт часу) — це збій, а не «новин немає»
+        logger.warning(f'Дайджест {category}: жодне з {len(urls)} джерел не відповіло')
+        return DIGEST_FAILED_TEXT
     if not all_articles:
-        return 'За останні 24 години свіжих публікацій не знайдено на наданих джерелах.'
-    # Готуємо консолідований markdown для Gemini
-    blocks = []
-    for a in all_articles[:10]:
-        pub = a['published_at'] or 'unknown'
-        blocks.append(f"- {a['title']}\n{a['url']}\nОпубліковано: {pub}\n\n{a['markdown']}")
-    joined = "\n\n".join(blocks)[:25000]
+        return 'За останні 24 години свіжих публікацій не знайдено на наданих джерелах.' + note
+    # Набір статей не змінився — повторно використовуємо попередню відповідь Gemini
+    cache_key = _articles_fingerprint(category, all_articles)
+    cached = _digest_cache_get(cache_key)
+    if cached is not None:
+        _bump_digest_stat('hits')
+        logger.info(f'Дайджест {category}: набір статей не змінився, беремо з кешу; статистика {_digest_stats}')
+        return cached + note
+    _bump_digest_stat('misses')
+    try:
+        # map: кожна стаття → стислі нотатки (паралельно, з кешем по URL)
+        notes = condense_articles(per_source, deadline=map_deadline)
+        # reduce: дайджест з нотаток усіх джерел у межах бюджету токенів
+        joined = _fit_notes_to_budget(notes, category, deadline=map_deadline)
+        prompt = (
+            f"Ось стислі нотатки по останніх матеріалах (до 24 годин) по категорії '{category}'. "
+            f"Зроби стислий дайджест і цікавий висновок по останіх новинах, розскажи свою точку зору приводу новин, дай особистий висновок і прогноз застасування технології чи прогноз подій, коли це доречно: 10-15 маркованих пунктів з фактами (дати/цифри/імена), додай 'Висновок: ...'.\n\n"
+            f"Матеріали:\n{joined}"
+        )
+        text = generate_text(prompt, on_text) or DIGEST_FAILED_TEXT
+    except Exception as e:
+        logger.error(f'Помилка summarize_category_recent: {e}')
+        return DIGEST_FAILED_TEXT
+    if text == DIGEST_FAILED_TEXT:
+        return text
+    _digest_cache_put(cache_key, text)
+    return text + note
+
+
+# ----------------------- MAP-REDUCE ПІДСУМОВУВАННЯ -----------------------
+_summarize_cfg = _cfg.get('news_summarize', {})
+GEMINI_MAP_WORKERS = int(_summarize_cfg.get('map_workers', 4))
+REDUCE_TOKEN_BUDGET = int(_summarize_cfg.get('reduce_token_budget', 8000))
+CONDENSE_FALLBACK_CHARS = 600
+
+_gemini_pool = ThreadPoolExecutor(max_workers=GEMINI_MAP_WORKERS, thread_name_prefix='gemini-map')
+
+
+class CondensedArticleStore:
+    """Стислі нотатки по статтях (канонічний URL → текст): кожна стаття стискається Gemini лише раз."""
+
+    RETENTION_SEC = 30 * 86400
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS condensed (url TEXT PRIMARY KEY, summary TEXT NOT NULL, created_at REAL NOT NULL)')
+        # Старші за місяць статті у дайджест уже не потрапляють
+        self._conn.execute('DELETE FROM condensed WHERE created_at < ?', (_time.time() - self.RETENTION_SEC,))
+        self._conn.commit()
+
+    def get(self, url: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute('SELECT summary FROM condensed WHERE url=?', (canonical_url(url),)).fetchone()
+        return row[0] if row else None
+
+    def put(self, url: str, summary: str) -> None:
+        try:
+            with self._lock:
+                self._conn.execute('INSERT OR REPLACE INTO condensed (url, summary, created_at) VALUES (?, ?, ?)',
+                                   (canonical_url(url), summary, _time.time()))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f'Не вдалося зберегти нотатки статті ({url}): {e}')
+
+
+condensed_store = CondensedArticleStore(SCRAPE_CACHE_PATH)
+
+
+def _condense_fallback(article: dict) -> str:
+    return (article.get('markdown') or '')[:CONDENSE_FALLBACK_CHARS]
+
+
+def condense_article(article: dict) -> str:
+    """Map-крок: 3-5 речень фактів по статті. Результат кешується назавжди; при помилці — початок тексту без кешу."""
+    cached = condensed_store.get(article['url'])
+    if cached is not None:
+        return cached
     prompt = (
-        f"Ось список останніх матеріалів (до 24 годин) по категорії '{category}'. "
-        f"Зроби стислий дайджест і цікавий висновок по останіх новинах, розскажи свою точку зору приводу новин, дай особистий висновок і прогноз застасування технології чи прогноз подій, коли це доречно: 10-15 маркованих пунктів з фактами (дати/цифри/імена), додай 'Висновок: ...'.\n\n"
-        f"Матеріали:\n{joined}"
+        "Стисни статтю до 3-5 речень українською, зберігаючи ключові факти: дати, цифри, імена, місця. "
+        "Без вступу і оцінок, лише зміст.\n\n"
+        f"Заголовок: {article['title']}\n\n{article['markdown']}"
     )
     try:
-        response = model.generate_content(prompt)
-        return (response.text or '').strip() or 'Не вдалося сформувати підсумок.'
+        summary = generate_text(prompt)
     except Exception as e:
-        logger.error(f'Помилка summarize_category_recent: {e}')
-        return 'Не вдалося сформувати підсумок.'
+        logger.warning(f'Не вдалося стиснути статтю {article["url"]}: {e}')
+        summary = ''
+    if not summary:
+        return _condense_fallback(article)
+    condensed_store.put(article['url'], summary)
+    return summary
+
+
+def condense_articles(per_source: list[list[dict]], deadline: float | None = None) -> list[list[str]]:
+    """Паралельно стискає всі статті; повертає нотатки в тій самій структурі (по джерелах, у порядку статей).
+
+    Статті, не стиснуті до deadline (time.monotonic()), ідуть у reduce обрізаним текстом, як при помилці;
+    запущені виклики Gemini дозавершуються у фоні й потрапляють у кеш для наступного дайджесту.
+    """
+    futures = [[(a, _gemini_pool.submit(condense_article, a)) for a in articles] for articles in per_source]
+    notes: list[list[str]] = []
+    late = 0
+    for source in futures:
+        source_notes = []
+        for a, fut in source:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - _time.monotonic())
+                summary = fut.result(timeout=timeout)
+            except FutureTimeoutError:
+                fut.cancel()
+                late += 1
+                summary = _condense_fallback(a)
+            pub = a['published_at'] or 'unknown'
+            source_notes.append(f"- {a['title']} ({_site_host(a['url'])}, опубліковано: {pub})\n{a['url']}\n{summary}")
+        notes.append(source_notes)
+    if late:
+        logger.warning(f'Map-крок: {late} статей не стиснуто вчасно, беремо початок тексту')
+    return notes
+
+
+def _count_tokens(text: str, deadline: float | None = None) -> int:
+    if deadline is not None and _time.monotonic() >= deadline:
+        return len(text) // 4 + 1
+    try:
+        with metrics.timed('gemini_count_tokens'):
+            return int(_genai_model().count_tokens(text).total_tokens)
+    except Exception as e:
+        logger.debug(f'count_tokens недоступний, оцінюємо за довжиною: {e}')
+        return len(text) // 4 + 1
+
+
+def _fit_notes_to_budget(notes: list[list[str]], category: str, deadline: float | None = None) -> str:
+    """Зводить нотатки в один текст не більше REDUCE_TOKEN_BUDGET токенів.
+
+    Нотатки чергуються по джерелах (перша стаття кожного джерела, потім друга і т.д.), тож
+    при скороченні відкидаються найменш пріоритетні статті, а кожне джерело лишається представленим.
+    """
+    ordered: list[str] = []
+    for rank in range(max((len(n) for n in notes), default=0)):
+        ordered.extend(n[rank] for n in notes if rank < len(n))
+    count = len(ordered)
+    joined = "\n\n".join(ordered)
+    for _ in range(3):
+        # Після deadline токени лише оцінюємо за довжиною, без запиту до Gemini
+        tokens = _count_tokens(joined, deadline)
+        if tokens <= REDUCE_TOKEN_BUDGET or count <= 1:
+            break
+        # Пропорційно зменшуємо кількість нотаток із запасом 10% і перевіряємо знову
+        count = max(1, min(count - 1, int(count * REDUCE_TOKEN_BUDGET / tokens * 0.9)))
+        joined = "\n\n".join(ordered[:count])
+    if count < len(ordered):
+        logger.info(f'Дайджест {category}: у бюджет {REDUCE_TOKEN_BUDGET} токенів увійшло {count} з {len(ordered)} нотаток')
+    return joined
+
+
+# ----------------------- ФОНОВІ ДАЙДЖЕСТИ -----------------------
+_news_refresh_cfg = _cfg.get('news_refresh', {})
+NEWS_REFRESH_ENABLED = bool(_news_refresh_cfg.get('enabled', True))
+NEWS_REFRESH_INTERVAL_SEC = int(_news_refresh_cfg.get('interval_minutes', 60)) * 60
+NEWS_REFRESH_STAGGER_SEC = int(_news_refresh_cfg.get('stagger_seconds', 120))
+NEWS_DIGEST_HOURS = int(_news_refresh_cfg.get('hours', 24))
+
+_digest_store_path = Path(os.getenv('NEWS_DIGESTS_FILE', 'news_digests.json'))
+_digest_store_lock = threading.Lock()
+_digest_store: dict[str, dict] = {}
+# Остання спроба оновлення категорії: {'at': час, 'failures': невдач поспіль}; лише в пам'яті
+_digest_attempts: dict[str, dict] = {}
+
+
+def _load_digests() -> None:
+    try:
+        if _digest_store_path.exists():
+            data = json.loads(_digest_store_path.read_text(encoding='utf-8'))
+            if isinstance(data, dict):
+                with _digest_store_lock:
+                    _digest_store.update(data)
+    except Exception as e:
+        logger.warning(f'Не вдалося завантажити {_digest_store_path}: {e}')
+
+
+def _save_digests() -> None:
+    try:
+        with _digest_store_lock:
+            payload = json.dumps(_digest_store, ensure_ascii=False)
+        tmp = _digest_store_path.with_suffix('.tmp')
+        tmp.write_text(payload, encoding='utf-8')
+        tmp.replace(_digest_store_path)
+    except Exception as e:
+        logger.warning(f'Не вдалося зберегти {_digest_store_path}: {e}')
+
+
+def get_stored_digest(category: str) -> dict | None:
+    with _digest_store_lock:
+        entry = _digest_store.get(category)
+        return dict(entry) if entry else None
+
+
+def refresh_category_digest(category: str, on_text=None) -> dict | None:
+    """Перераховує дайджест категорії і зберігає його з часом оновлення.
+
+    Невдалий прогін (помилка Gemini) не затирає попередній збережений дайджест.
+    """
+    urls = get_category_urls(category)
+    if not urls:
+        return None
+    started = _time.time()
+    text = summarize_category_recent(category, urls, hours=NEWS_DIGEST_HOURS, on_text=on_text)
+    if text == DIGEST_FAILED_TEXT:
+        with _digest_store_lock:
+            failures = _digest_attempts.get(category, {}).get('failures', 0) + 1
+            _digest_attempts[category] = {'at': _time.time(), 'failures': failures}
+        logger.warning(f'Дайджест {category} не оновлено ({failures} невдач поспіль)')
+        return get_stored_digest(category)
+    entry = {'text': text, 'updated_at': _time.time()}
+    with _digest_store_lock:
+        _digest_store[category] = entry
+        _digest_attempts[category] = {'at': entry['updated_at'], 'failures': 0}
+    _save_digests()
+    logger.info(f'Дайджест {category} оновлено за {_time.time() - started:.1f}s')
+    return dict(entry)
+
+
+def _retry_delay(failures: int) -> float:
+    # Після невдачі категорія чекає дедалі довше, але не більше за звичайний інтервал оновлення
+    if not failures:
+        return 0.0
+    return min(NEWS_REFRESH_STAGGER_SEC * 2 ** (failures - 1), NEWS_REFRESH_INTERVAL_SEC)
+
+
+def _next_due_category() -> str | None:
+    # Категорія з найдавнішою спробою серед тих, чий дайджест старший за інтервал оновлення;
+    # невдала категорія не блокує решту, бо її спроба теж рахується
+    now = _time.time()
+    due = []
+    for category in NEWS_SOURCES:
+        entry = get_stored_digest(category)
+        updated = entry['updated_at'] if entry else 0.0
+        with _digest_store_lock:
+            attempt = dict(_digest_attempts.get(category, {}))
+        last_attempt = attempt.get('at', 0.0)
+        if now - updated < NEWS_REFRESH_INTERVAL_SEC:
+            continue
+        if now - last_attempt < _retry_delay(attempt.get('failures', 0)):
+            continue
+        due.append((max(updated, last_attempt), category))
+    return min(due)[1] if due else None
+
+
+def news_refresh_tick() -> bool:
+    # За один крок оновлюємо не більше однієї категорії, тож категорії природно рознесені
+    # в часі на NEWS_REFRESH_STAGGER_SEC і не б'ють по AnyCrawl та Gemini одночасно.
+    # False після невдачі — планувальник розтягує інтервал, а не б'є по сервісах кожні STAGGER секунд
+    category = _next_due_category()
+    if not category:
+        return False
+    refresh_category_digest(category)
+    with _digest_store_lock:
+        return not _digest_attempts.get(category, {}).get('failures')
+
+
+def _format_age(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return 'щойно'
+    if minutes < 60:
+        return f'{minutes} хв тому'
+    return f'{minutes // 60} год {minutes % 60} хв тому'
+
+
+_load_digests()
+
+
+# ----------------------- ПЛАНУВАЛЬНИК ФОНОВИХ ЗАВДАНЬ -----------------------
+SCHEDULER_WORKERS = 4
+SCHEDULER_STOP_TIMEOUT_SEC = 15
+
+
+class PeriodicScheduler:
+    """Один потік-планувальник для всіх періодичних задач замість окремих циклів зі sleep.
+
+    Задача — функція без аргументів. Якщо задано max_interval, інтервал адаптивний:
+    повернення True (була активність) скидає його до базового, а False/None чи помилка
+    множать на backoff до max_interval. Наступний запуск планується лише після завершення
+    попереднього, тож задача не перекривається сама з собою; довші за overrun_sec прогони логуються.
+    """
+
+    def __init__(self, workers: int = SCHEDULER_WORKERS, clock=_time.monotonic):
+        self.clock = clock
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sched')
+        self._cond = threading.Condition()
+        self._tasks: dict[str, dict] = {}
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self._running: set[Future] = set()
+
+    def add(self, name: str, fn, interval: float, max_interval: float | None = None, backoff: float = 2.0,
+            jitter: float = 0.1, initial_delay: float = 0.0, overrun_sec: float | None = None) -> None:
+        with self._cond:
+            self._tasks[name] = {
+                'fn': fn, 'base': interval, 'interval': interval, 'max': max_interval, 'backoff': backoff,
+                'jitter': jitter, 'overrun': overrun_sec or max(interval, 60), 'next_run': self.clock() + initial_delay,
+                'running': False, 'runs': 0, 'errors': 0, 'overruns': 0, 'total_sec': 0.0, 'max_sec': 0.0, 'last_sec': 0.0,
+            }
+            self._cond.notify()
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = SCHEDULER_STOP_TIMEOUT_SEC) -> None:
+        """Нових запусків більше не буде; чекаємо поточні прогони не довше timeout."""
+        with self._cond:
+            self._stopping = True
+            running = set(self._running)
+            self._cond.notify_all()
+        if running:
+            logger.info(f'Scheduler: очікую завершення {len(running)} задач')
+            wait(running, timeout=timeout)
+        self._pool.shutdown(wait=False)
+        logger.info(f'Scheduler зупинено; статистика {self.stats()}')
+
+    def _loop(self) -> None:
+        with self._cond:
+            while not self._stopping:
+                now = self.clock()
+                idle = [t for t in self._tasks.values() if not t['running']]
+                due = [(name, t) for name, t in self._tasks.items() if not t['running'] and t['next_run'] <= now]
+                for name, task in due:
+                    task['running'] = True
+                    fut = self._pool.submit(self._run, name, task)
+                    self._running.add(fut)
+                    fut.add_done_callback(self._discard)
+                if due:
+                    continue
+                timeout = min((t['next_run'] for t in idle), default=None)
+                self._cond.wait(timeout=None if timeout is None else max(0.0, timeout - now))
+
+    def _discard(self, fut: Future) -> None:
+        with self._cond:
+            self._running.discard(fut)
+
+    def _run(self, name: str, task: dict) -> None:
+        started = self.clock()
+        active, failed = False, False
+        try:
+            active = bool(task['fn']())
+        except Exception as e:
+            failed = True
+            logger.error('Scheduler: задача %s завершилась помилкою: %s', name, e)
+        took = self.clock() - started
+        metrics.observe('scheduler_task', took, task=name)
+        if failed:
+            metrics.inc('scheduler_task_errors', task=name)
+        if took > task['overrun']:
+            task['overruns'] += 1
+            logger.warning('Scheduler: задача %s працювала %.1fs (очікувано до %gs)', name, took, task['overrun'])
+        with self._cond:
+            task['runs'] += 1
+            task['errors'] += failed
+            task['last_sec'] = took
+            task['total_sec'] += took
+            task['max_sec'] = max(task['max_sec'], took)
+            if task['max'] is not None:
+                task['interval'] = task['base'] if active else min(task['max'], task['interval'] * task['backoff'])
+            spread = task['interval'] * task['jitter']
+            task['next_run'] = self.clock() + task['interval'] + random.uniform(-spread, spread)
+            task['running'] = False
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {name: {'runs': t['runs'], 'errors': t['errors'], 'overruns': t['overruns'],
+                           'interval': round(t['interval'], 1), 'last_ms': round(t['last_sec'] * 1000),
+                           'avg_ms': round(t['total_sec'] / t['runs'] * 1000) if t['runs'] else 0,
+                           'max_ms': round(t['max_sec'] * 1000)}
+                    for name, t in self._tasks.items()}
+
+
+scheduler = PeriodicScheduler()
 
 
 # Ініціалізація Telegram бота
 bot = telebot.TeleBot(TELEGRAM_TOKEN)
 
+# ----------------------- КОРИСТУВАЧІ -----------------------
+# config.json "users": [{"id": 123, "name": "Оля", "chat_id": null, "gmail_token": "token_123.json",
+#                        "sheet": "Shopping List", "owner": false}, ...]
+# Усі поля, крім id, необов'язкові. ALLOWED_USER_ID з .env додається як власник, якщо його немає в списку.
+# Пошта, таблиця і стан наглядачів — свої в кожного; новини, кеш скрапінгу і дайджести спільні.
+
+
+class UserProfile:
+    """Дозволений користувач: Gmail-токен, таблиця, чат для сповіщень і стан наглядачів.
+
+    Gmail-клієнт, сховище побачених листів і historyId створюються при першому зверненні.
+    Основний користувач зберігає старі імена файлів (token.json, gmail_seen.sqlite3, gmail_state.json),
+    решта отримує суфікс _<id>.
+    """
+
+    def __init__(self, user_id: int | None, name: str = '', chat_id: int | None = None,
+                 gmail_token: str | None = None, sheet: str | None = None,
+                 owner: bool = False, primary: bool = False):
+        self.user_id = user_id
+        self.name = name or (str(user_id) if user_id is not None else 'default')
+        self.chat_id = chat_id
+        self.last_chat_id: int | None = None  # чат останньої взаємодії, якщо chat_id не задано
+        self.owner = owner
+        self.primary = primary
+        self._gmail_token = gmail_token
+        self._sheet = sheet
+        self._lock = threading.Lock()
+        self._gmail: 'GmailServiceManager | None' = None
+        self._seen: 'SeenMessageStore | None' = None
+        self._gmail_state: dict | None = None
+
+    def __str__(self) -> str:
+        return self.name
+
+    def _path(self, base: str) -> str:
+        if self.primary:
+            return base
+        p = Path(base)
+        return str(p.with_name(f'{p.stem}_{self.user_id}{p.suffix}'))
+
+    @property
+    def gmail_token_file(self) -> str:
+        return self._gmail_token or self._path(GOOGLE_TOKEN_FILE)
+
+    @property
+    def sheet_name(self) -> str:
+        return self._sheet or SHEET_NAME
+
+    @property
+    def notify_chat_id(self) -> int | None:
+        # Особистий чат з ботом має той самий id, що й користувач
+        return self.chat_id or self.last_chat_id or self.user_id
+
+    @property
+    def gmail(self) -> 'GmailServiceManager':
+        with self._lock:
+            if self._gmail is None:
+                self._gmail = GmailServiceManager(self.gmail_token_file, GOOGLE_CREDENTIALS_FILE, SCOPES)
+            return self._gmail
+
+    @property
+    def gmail_seen(self) -> 'SeenMessageStore':
+        with self._lock:
+            if self._seen is None:
+                self._seen = SeenMessageStore(self._path(GMAIL_SEEN_DB), retention_sec=2 * GMAIL_WATCH_WINDOW_SEC,
+                                              legacy_json=Path('gmail_seen.json') if self.primary else None)
+            return self._seen
+
+    @property
+    def gmail_state(self) -> dict:
+        with self._lock:
+            if self._gmail_state is None:
+                self._gmail_state = _load_gmail_state(Path(self._path(GMAIL_STATE_FILE)))
+            return self._gmail_state
+
+    def save_gmail_state(self) -> None:
+        _save_gmail_state(Path(self._path(GMAIL_STATE_FILE)), self.gmail_state)
+
+    def refresh_gmail_ahead(self) -> None:
+        # Лише для вже відкритого клієнта: токени неактивних користувачів не чіпаємо
+        if self._gmail is not None:
+            self._gmail.refresh_ahead()
+
+    def maintain_gmail_seen(self) -> None:
+        if self._seen is not None:
+            self._seen.maintain()
+
+    def gmail_stats(self) -> dict | None:
+        return self._gmail.stats_summary() if self._gmail is not None else None
+
+
+class UserRegistry:
+    """Дозволені користувачі за Telegram id.
+
+    Без жодного налаштованого користувача бот працює у відкритому режимі, як раніше без ALLOWED_USER_ID:
+    будь-хто отримує один спільний профіль.
+    """
+
+    def __init__(self, profiles: list[UserProfile]):
+        self._by_id = {p.user_id: p for p in profiles if p.user_id is not None}
+        self._open = None if self._by_id else UserProfile(None, primary=True)
+
+    @classmethod
+    def from_config(cls, entries: list[dict], env_user_id: int | None) -> 'UserRegistry':
+        profiles: list[UserProfile] = []
+        for entry in entries:
+            try:
+                uid = int(entry['id'])
+            except (KeyError, TypeError, ValueError):
+                logger.error(f'config.json users: пропущено запис без коректного id: {entry}')
+                continue
+            profiles.append(UserProfile(
+                uid, name=entry.get('name', ''), chat_id=entry.get('chat_id'),
+                gmail_token=entry.get('gmail_token'), sheet=entry.get('sheet'),
+                owner=bool(entry.get('owner', uid == env_user_id)),
+            ))
+        if env_user_id is not None and all(p.user_id != env_user_id for p in profiles):
+            profiles.insert(0, UserProfile(env_user_id, owner=True))
+        if profiles:
+            primary = next((p for p in profiles if p.user_id == env_user_id), profiles[0])
+            primary.primary = True
+        return cls(profiles)
+
+    def get(self, user_id: int | None) -> UserProfile | None:
+        if self._open is not None:
+            return self._open
+        return self._by_id.get(user_id)
+
+    def all(self) -> list[UserProfile]:
+        return [self._open] if self._open is not None else list(self._by_id.values())
+
+
+user_registry = UserRegistry.from_config(_cfg.get('users', []), ALLOWED_USER_ID_INT)
+
+
+def authorized(action: str):
+    """Декоратор хендлера: пускає лише користувачів з реєстру і передає профіль другим аргументом."""
+    def decorate(fn):
+        def wrapper(update):
+            from_user = update.from_user
+            user = user_registry.get(from_user.id if from_user else None)
+            if user is None:
+                logger.warning(f"Доступ до {action} заборонено для id={from_user.id if from_user else None}")
+                if isinstance(update, types.CallbackQuery):
+                    bot.answer_callback_query(update.id, "Немає доступу")
+                else:
+                    reply_to(update, "Вибачте, у вас немає доступу до цього бота.")
+                return None
+            message = update.message if isinstance(update, types.CallbackQuery) else update
+            user.last_chat_id = message.chat.id
+            return fn(update, user)
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorate
+
+
+def run_for_each(task: str, targets: list, fn) -> bool:
+    """fn(target) для кожного користувача/таблиці по черзі в одному потоці задачі планувальника.
+
+    Помилка однієї цілі не зупиняє решту; якщо впали всі — виняток іде в планувальник (там backoff).
+    """
+    changed = False
+    failed = 0
+    error: Exception | None = None
+    for target in targets:
+        try:
+            changed = bool(fn(target)) or changed
+        except Exception as e:
+            failed += 1
+            error = e
+            logger.warning('%s (%s): %s', task, target, e)
+    if error is not None and failed == len(targets):
+        raise error
+    return changed
+# --------------------- END КОРИСТУВАЧІ ---------------------
+
+
 # ----------------------- GMAIL AUTO WATCHER -----------------------
-_seen_store_path = Path('gmail_seen.json')
-_seen_ids_lock = threading.Lock()
-_seen_ids: set[str] = set()
-_notification_chat_id: Optional[int] = None
+GMAIL_SEEN_DB = os.getenv('GMAIL_SEEN_DB', 'gmail_seen.sqlite3')
+GMAIL_STATE_FILE = 'gmail_state.json'
+GMAIL_WATCH_WINDOW_SEC = 12 * 3600  # вікно пошуку наглядача (newer_than:12h)
+GMAIL_NOTIFY_TIMEOUT_SEC = 60  # скільки наглядач чекає, поки черга відправки доставить сповіщення
+
+
+class SeenMessageStore:
+    """Множина вже сповіщених листів у SQLite: id + час першої появи.
+
+    Вставка — один INSERT замість перезапису всього файлу; записи, старші за вікно наглядача
+    (з запасом), видаляються, а файл періодично стискається VACUUM.
+    """
+
+    MAINTAIN_EVERY_SEC = 3600  # інтервал задачі обслуговування в планувальнику
+    VACUUM_AFTER_DELETES = 5000
+
+    def __init__(self, path: str, retention_sec: int, legacy_json: Path | None = None):
+        self.path = path
+        self.retention_sec = retention_sec
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY, first_seen REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS seen_first_seen ON seen (first_seen)')
+        self._conn.commit()
+        self._deleted_since_vacuum = 0
+        if legacy_json is not None:
+            self._migrate_json(legacy_json)
+
+    def _migrate_json(self, path: Path) -> None:
+        # Старий gmail_seen.json — список id без часу; вважаємо, що всі побачені зараз
+        try:
+            if not path.exists():
+                return
+            data = json.loads(path.read_text(encoding='utf-8'))
+            if isinstance(data, list):
+                self.add_many(str(x) for x in data)
+            path.replace(path.with_name(path.name + '.migrated'))
+            logger.info(f'Мігровано {len(data) if isinstance(data, list) else 0} id з {path} у {self.path}')
+        except Exception as e:
+            logger.warning(f'Не вдалося мігрувати {path}: {e}')
+
+    def filter_unseen(self, ids: list[str]) -> list[str]:
+        if not ids:
+            return []
+        with self._lock:
+            placeholders = ','.join('?' * len(ids))
+            known = {row[0] for row in self._conn.execute(f'SELECT id FROM seen WHERE id IN ({placeholders})', list(ids))}
+        return [mid for mid in ids if mid not in known]
+
+    def add(self, mid: str) -> None:
+        self.add_many([mid])
+
+    def add_many(self, ids) -> None:
+        now = _time.time()
+        with self._lock:
+            self._conn.executemany('INSERT OR IGNORE INTO seen (id, first_seen) VALUES (?, ?)', ((str(m), now) for m in ids))
+            self._conn.commit()
+
+    def prune(self) -> int:
+        cutoff = _time.time() - self.retention_sec
+        with self._lock:
+            cur = self._conn.execute('DELETE FROM seen WHERE first_seen < ?', (cutoff,))
+            self._conn.commit()
+            self._deleted_since_vacuum += cur.rowcount
+            return cur.rowcount
+
+    def compact(self) -> None:
+        with self._lock:
+            self._conn.execute('VACUUM')
+            self._deleted_since_vacuum = 0
+
+    def maintain(self) -> None:
+        """Видаляє застарілі id; після великої кількості видалень стискає файл."""
+        removed = self.prune()
+        if self._deleted_since_vacuum >= self.VACUUM_AFTER_DELETES:
+            self.compact()
+        if removed:
+            logger.debug(f'Gmail seen store: видалено {removed} застарілих id')
+
+
+def _notify_new_email(user: UserProfile, item: dict) -> list[Future]:
+    chat_id = user.notify_chat_id
+    if not chat_id:
+        return []
+    text = f"Новий лист!\nВід: {item.get('from','')}\nТема: {item.get('subject','(без теми)')}\n{item.get('snippet','')}"
+    return send_long_text(chat_id, text)
+
 
+# Інкрементальна синхронізація: зберігаємо historyId і питаємо в Gmail лише нові messageAdded
+GMAIL_SYNC_MODE = os.getenv('GMAIL_SYNC_MODE', 'history')  # 'history' або 'search' (старий повний пошук)
+GMAIL_WATCH_QUERY = 'label:inbox is:unread newer_than:12h'
 
-def _load_seen_ids() -> None:
+
+def _load_gmail_state(path: Path) -> dict:
+    state: dict = {'history_id': None}
     try:
-        if _seen_store_path.exists():
-            data = json.loads(_seen_store_path.read_text(encoding='utf-8'))
-            if isinstance(data, list):
-                with _seen_ids_lock:
-                    _seen_ids.update(str(x) for x in data)
+        if path.exists():
+            data = json.loads(path.read_text(encoding='utf-8'))
+            if isinstance(data, dict):
+                state.update(data)
     except Exception as e:
-        logger.warning(f'Не вдалося завантажити gmail_seen.json: {e}')
+        logger.warning(f'Не вдалося завантажити {path}: {e}')
+    return state
 
 
-def _save_seen_ids() -> None:
+def _save_gmail_state(path: Path, state: dict) -> None:
     try:
-        with _seen_ids_lock:
-            _seen_store_path.write_text(json.dumps(list(_seen_ids)), encoding='utf-8')
+        path.write_text(json.dumps(state), encoding='utf-8')
     except Exception as e:
-        logger.warning(f'Не вдалося зберегти gmail_seen.json: {e}')
+        logger.warning(f'Не вдалося зберегти {path}: {e}')
 
 
-def set_notification_chat(chat_id: int) -> None:
-    global _notification_chat_id
-    _notification_chat_id = chat_id
+def _http_status(e: Exception) -> int | None:
+    # googleapiclient.errors.HttpError тримає статус у e.resp.status
+    status = getattr(getattr(e, 'resp', None), 'status', None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
 
 
-def _notify_new_email(item: dict) -> None:
-    if _notification_chat_id:
-        text = f"Новий лист!\nВід: {item.get('from','')}\nТема: {item.get('subject','(без теми)')}\n{item.get('snippet','')}"
-        send_long_text(_notification_chat_id, text)
-    elif ALLOWED_USER_ID_INT:
-        text = f"Новий лист!\nВід: {item.get('from','')}\nТема: {item.get('subject','(без теми)')}\n{item.get('snippet','')}"
-        try:
-            bot.send_message(ALLOWED_USER_ID_INT, text)
-        except Exception as e:
-            logger.warning(f'Не вдалося відправити повідомлення користувачу: {e}')
+def gmail_full_sync(service) -> tuple[list[str], str | None]:
+    """Повна синхронізація: поточний historyId профілю + пошук непрочитаних за вікно наглядача."""
+    # historyId беремо до пошуку, щоб лист, що прийде між викликами, потрапив у наступну історію
+    with metrics.timed('gmail_api', op='getProfile'):
+        profile = service.users().getProfile(userId='me').execute()
+    msgs = list_messages(service, query=GMAIL_WATCH_QUERY, max_results=10)
+    history_id = profile.get('historyId')
+    return [str(m.get('id')) for m in msgs], str(history_id) if history_id else None
+
 
+def gmail_incremental_sync(service, start_history_id: str) -> tuple[list[str], str]:
+    """Нові непрочитані листи інбоксу з моменту start_history_id через users.history.list.
 
-def gmail_watcher_loop(interval_sec: int = 30) -> None:
-    _load_seen_ids()
+    Якщо historyId застарів, Gmail відповідає 404 — тоді виняток пробрасується і викликач робить повну синхронізацію.
+    """
+    ids: list[str] = []
+    latest = start_history_id
+    page_token = None
     while True:
+        with metrics.timed('gmail_api', op='history.list'):
+            res = service.users().history().list(
+                userId='me', startHistoryId=start_history_id, historyTypes=['messageAdded'],
+                labelId='INBOX', pageToken=page_token,
+            ).execute()
+        for h in res.get('history', []):
+            for added in h.get('messagesAdded', []):
+                msg = added.get('message', {})
+                mid = str(msg.get('id'))
+                if 'UNREAD' in msg.get('labelIds', []) and mid not in ids:
+                    ids.append(mid)
+        latest = str(res.get('historyId') or latest)
+        page_token = res.get('nextPageToken')
+        if not page_token:
+            break
+    return ids, latest
+
+
+def gmail_sync_new_ids(service, state: dict) -> list[str]:
+    """Кандидати на сповіщення за один тік наглядача; state зберігає останній historyId."""
+    if GMAIL_SYNC_MODE != 'history':
+        return [str(m.get('id')) for m in list_messages(service, query=GMAIL_WATCH_QUERY, max_results=10)]
+    if state.get('history_id'):
         try:
-            # Чекаємо поки не буде авторизації (token.json)
-            if not Path(GOOGLE_TOKEN_FILE).exists():
-                logger.debug('Gmail watcher: очікує авторизацію (немає token.json)')
-                _time.sleep(interval_sec)
-                continue
-            service = get_gmail_service()
-            if not service:
-                _time.sleep(interval_sec)
-                continue
-            # Шукаємо нові непрочитані за 12h 
-            msgs = list_messages(service, query='label:inbox is:unread newer_than:12h', max_results=10)
-            for m in msgs:
-                mid = str(m.get('id'))
-                with _seen_ids_lock:
-                    if mid in _seen_ids:
-                        continue
-                details = fetch_message_details(service, mid)
-                if details:
-                    _notify_new_email(details)
-                    with _seen_ids_lock:
-                        _seen_ids.add(mid)
-                    _save_seen_ids()
+            ids, history_id = gmail_incremental_sync(service, state['history_id'])
+            state['history_id'] = history_id
+            return ids
         except Exception as e:
-            logger.error(f'Gmail watcher error: {e}')
-        finally:
-            _time.sleep(interval_sec)
+            if _http_status(e) != 404:
+                raise
+            logger.warning('Gmail historyId застарів — виконуємо повну синхронізацію')
+    ids, history_id = gmail_full_sync(service)
+    state['history_id'] = history_id
+    return ids
+
+
+def gmail_watch_user(user: UserProfile) -> bool:
+    """Один прохід наглядача пошти для користувача; True, якщо були нові листи.
+
+    Нові id спершу потрапляють у state['pending'] і зберігаються разом з historyId, тож лист,
+    деталі якого не вдалося отримати, повториться на наступному тіку, хоча історія вже пішла далі.
+    """
+    # Чекаємо поки не буде авторизації (token.json)
+    if not Path(user.gmail_token_file).exists():
+        logger.debug('Gmail watcher: %s очікує авторизацію (немає %s)', user, user.gmail_token_file, extra=LOG_SAMPLED)
+        return False
+    service = get_gmail_service(user)
+    if not service:
+        return False
+    state = user.gmail_state
+    before = json.dumps(state, sort_keys=True)
+    new_ids = gmail_sync_new_ids(service, state)
+    pending: dict = state.setdefault('pending', {})  # id -> час першої появи
+    now = _time.time()
+    for mid in new_ids:
+        pending.setdefault(mid, now)
+    try:
+        for mid, first_seen in list(pending.items()):
+            if now - first_seen > GMAIL_WATCH_WINDOW_SEC:
+                logger.warning(f'Gmail watcher ({user}): лист {mid} так і не вдалося отримати, пропускаємо')
+                del pending[mid]
+        seen = user.gmail_seen
+        unseen = seen.filter_unseen(list(pending))
+        for mid in set(pending) - set(unseen):
+            del pending[mid]
+        if not unseen:
+            return False
+        # Спершу ставимо всі сповіщення в чергу, потім чекаємо на відправку: лист вважається побаченим
+        # лише після того, як Telegram його прийняв, інакше він лишається в pending до наступного тіку
+        sends = [(details['id'], _notify_new_email(user, details))
+                 for details in fetch_messages_details(service, unseen)]
+        notified = False
+        for mid, futures in sends:
+            try:
+                for fut in futures:
+                    fut.result(timeout=GMAIL_NOTIFY_TIMEOUT_SEC)
+            except Exception as e:
+                logger.warning(f'Gmail watcher ({user}): не вдалося надіслати сповіщення про {mid}: {e}')
+                continue
+            seen.add(mid)
+            pending.pop(mid, None)
+            notified = True
+        return notified
+    finally:
+        if json.dumps(state, sort_keys=True) != before:
+            user.save_gmail_state()
+
+
+def gmail_watcher_tick() -> bool:
+    """Один прохід наглядача пошти по всіх користувачах; True, якщо хоч у когось були нові листи."""
+    return run_for_each('Gmail watcher', user_registry.all(), gmail_watch_user)
 # --------------------- END GMAIL AUTO WATCHER ---------------------
 
 
@@ -352,26 +2411,130 @@ GOOGLE_CREDENTIALS_FILE = os.getenv('GOOGLE_CREDENTIALS_FILE', 'credentials.json
 GOOGLE_TOKEN_FILE = os.getenv('GOOGLE_TOKEN_FILE', 'token.json')
 
 
-def get_gmail_service():
-    creds = None
-    try:
-        if os.path.exists(GOOGLE_TOKEN_FILE):
-            creds = UserCredentials.from_authorized_user_file(GOOGLE_TOKEN_FILE, SCOPES)
+def _google_auth_request():
+    # Клієнтські бібліотеки Google вантажимо лише коли справді потрібна пошта
+    from google.auth.transport.requests import Request
+    return Request()
+
+
+class GmailServiceManager:
+    """Довгоживучий доступ до Gmail API, спільний для наглядача і хендлерів.
+
+    Облікові дані читаються з token.json один раз і оновлюються заздалегідь у фоні;
+    token.json перезаписується лише коли його вміст справді змінився. Об'єкт сервісу
+    (розбір discovery-документа) будується один раз на потік, бо httplib2 у googleapiclient
+    не потокобезпечний; після заміни облікових даних сервіси перебудовуються.
+    """
+
+    REFRESH_AHEAD_SEC = 300
+
+    def __init__(self, token_file: str, credentials_file: str, scopes: list[str]):
+        self.token_file = token_file
+        self.credentials_file = credentials_file
+        self.scopes = scopes
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._creds = None
+        self._token_json: str | None = None
+        self._generation = 0
+        self.stats = {'calls': 0, 'setup_seconds': 0.0, 'builds': 0, 'build_seconds': 0.0,
+                      'refreshes': 0, 'token_writes': 0}
+
+    def _load_credentials_locked(self, interactive: bool = False):
+        creds = self._creds
+        if creds is not None and creds.valid:
+            return creds
+        if creds is None and os.path.exists(self.token_file):
+            with open(self.token_file, 'r') as token:
+                self._token_json = token.read()
+            from google.oauth2.credentials import Credentials as UserCredentials
+            creds = UserCredentials.from_authorized_user_info(json.loads(self._token_json), self.scopes)
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
+                creds.refresh(_google_auth_request())
+                self.stats['refreshes'] += 1
             else:
-                if not os.path.exists(GOOGLE_CREDENTIALS_FILE):
+                if not interactive:
+                    # Браузерна авторизація блокує потік і прив'язала б акаунт того, хто сидить біля сервера
+                    logger.error(f'Gmail: немає дійсного {self.token_file}; потрібна авторизація через --gmail-auth')
+                    return None
+                if not os.path.exists(self.credentials_file):
                     logger.error('Не знайдено credentials.json для Gmail API')
                     return None
-                flow = InstalledAppFlow.from_client_secrets_file(GOOGLE_CREDENTIALS_FILE, SCOPES)
+                from google_auth_oauthlib.flow import InstalledAppFlow
+                flow = InstalledAppFlow.from_client_secrets_file(self.credentials_file, self.scopes)
                 creds = flow.run_local_server(port=0)
-            with open(GOOGLE_TOKEN_FILE, 'w') as token:
-                token.write(creds.to_json())
-        service = build('gmail', 'v1', credentials=creds)
-        return service
+        if creds is not self._creds:
+            self._creds = creds
+            self._generation += 1
+        self._persist_locked()
+        return creds
+
+    def _persist_locked(self) -> None:
+        data = self._creds.to_json()
+        if data == self._token_json:
+            return
+        tmp = f'{self.token_file}.tmp'
+        with open(tmp, 'w') as token:
+            token.write(data)
+        os.replace(tmp, self.token_file)
+        self._token_json = data
+        self.stats['token_writes'] += 1
+
+    def service(self, interactive: bool = False):
+        """Gmail-сервіс поточного потоку; будується лише при першому виклику в потоці.
+
+        interactive=True дозволяє браузерну OAuth-авторизацію — лише для --gmail-auth, не з хендлерів.
+        """
+        started = _time.perf_counter()
+        with self._lock:
+            creds = self._load_credentials_locked(interactive)
+            generation = self._generation
+        if not creds:
+            return None
+        local = self._local
+        if getattr(local, 'service', None) is None or local.generation != generation:
+            build_started = _time.perf_counter()
+            from googleapiclient.discovery import build
+            local.service = build('gmail', 'v1', credentials=creds, cache_discovery=False)
+            local.generation = generation
+            build_sec = _time.perf_counter() - build_started
+            with self._lock:
+                self.stats['builds'] += 1
+                self.stats['build_seconds'] += build_sec
+            logger.debug(f'Gmail service побудовано за {build_sec * 1000:.0f} ms ({threading.current_thread().name})')
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['setup_seconds'] += _time.perf_counter() - started
+        return local.service
+
+    def refresh_ahead(self) -> None:
+        """Оновлює access token, якщо до його закінчення лишилось менше REFRESH_AHEAD_SEC."""
+        with self._lock:
+            creds = self._creds
+            if not creds or not creds.refresh_token or not creds.expiry:
+                return
+            if creds.expiry - datetime.utcnow() > timedelta(seconds=self.REFRESH_AHEAD_SEC):
+                return
+            creds.refresh(_google_auth_request())
+            self.stats['refreshes'] += 1
+            self._persist_locked()
+            logger.debug('Gmail access token оновлено заздалегідь')
+
+    def stats_summary(self) -> dict:
+        with self._lock:
+            st = dict(self.stats)
+        calls = st['calls'] or 1
+        st['avg_setup_ms'] = round(st['setup_seconds'] / calls * 1000, 3)
+        st['avg_build_ms'] = round(st['build_seconds'] / (st['builds'] or 1) * 1000, 1)
+        return st
+
+
+def get_gmail_service(user: UserProfile):
+    try:
+        return user.gmail.service()
     except Exception as e:
-        logger.error(f'Помилка ініціалізації Gmail сервісу: {e}')
+        logger.error('Помилка ініціалізації Gmail сервісу: %s', e)
         return None
 
 
@@ -382,36 +2545,84 @@ def _get_header(headers: list[dict], name: str) -> str:
     return ''
 
 
+@metrics.instrument('gmail_api')
 def list_messages(service, query: str, max_results: int = 20) -> list[dict]:
     try:
         res = service.users().messages().list(userId='me', q=query, maxResults=max_results).execute()
         return res.get('messages', [])
     except Exception as e:
-        logger.error(f'Помилка list_messages: {e}')
+        logger.error('Помилка list_messages: %s', e)
         return []
 
 
+GMAIL_METADATA_HEADERS = ['Subject', 'From', 'Date']
+GMAIL_BATCH_SIZE = 50  # Gmail радить не більше 50 запитів в одному batch
+
+
+def _message_to_details(msg: dict, msg_id: str) -> dict:
+    payload = msg.get('payload', {})
+    headers = payload.get('headers', [])
+    subject = _get_header(headers, 'Subject') or '(без теми)'
+    from_h = _get_header(headers, 'From')
+    date_h = _get_header(headers, 'Date')
+    snippet = msg.get('snippet', '')
+    return {
+        'subject': subject,
+        'from': from_h,
+        'date': date_h,
+        'snippet': snippet,
+        'id': msg_id,
+    }
+
+
+@metrics.instrument('gmail_api')
 def fetch_message_details(service, msg_id: str) -> dict | None:
     try:
-        msg = service.users().messages().get(userId='me', id=msg_id, format='full').execute()
-        payload = msg.get('payload', {})
-        headers = payload.get('headers', [])
-        subject = _get_header(headers, 'Subject') or '(без теми)'
-        from_h = _get_header(headers, 'From')
-        date_h = _get_header(headers, 'Date')
-        snippet = msg.get('snippet', '')
-        return {
-            'subject': subject,
-            'from': from_h,
-            'date': date_h,
-            'snippet': snippet,
-            'id': msg_id,
-        }
+        msg = service.users().messages().get(
+            userId='me', id=msg_id, format='metadata', metadataHeaders=GMAIL_METADATA_HEADERS,
+        ).execute()
+        return _message_to_details(msg, msg_id)
     except Exception as e:
-        logger.error(f'Помилка fetch_message_details: {e}')
+        logger.error('Помилка fetch_message_details: %s', e)
         return None
 
 
+@metrics.instrument('gmail_api')
+def fetch_messages_details(service, msg_ids: list[str]) -> list[dict]:
+    """Заголовки (Subject/From/Date) і snippet для списку листів через Gmail batch API.
+
+    Використовує format='metadata', тож тіла листів не завантажуються; до GMAIL_BATCH_SIZE листів
+    за один HTTP-запит. Порядок результату відповідає msg_ids; листи з помилкою пропускаються.
+    """
+    ids = list(dict.fromkeys(str(m) for m in msg_ids))
+    results: dict[str, dict] = {}
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            logger.warning('Gmail batch: не вдалося отримати лист %s: %s', request_id, exception)
+            return
+        results[request_id] = _message_to_details(response, request_id)
+
+    for i in range(0, len(ids), GMAIL_BATCH_SIZE):
+        chunk = ids[i:i + GMAIL_BATCH_SIZE]
+        try:
+            batch = service.new_batch_http_request(callback=on_response)
+            for mid in chunk:
+                batch.add(service.users().messages().get(
+                    userId='me', id=mid, format='metadata', metadataHeaders=GMAIL_METADATA_HEADERS,
+                ), request_id=mid)
+            batch.execute()
+        except Exception as e:
+            # batch-запит цілком не пройшов — добираємо листи поодинці
+            logger.error('Помилка Gmail batch: %s', e)
+            for mid in chunk:
+                if mid not in results:
+                    d = fetch_message_details(service, mid)
+                    if d:
+                        results[mid] = d
+    return [results[mid] for mid in ids if mid in results]
+
+
 def format_messages_markdown(items: list[dict]) -> str:
     lines = []
     for it in items:
@@ -427,63 +2638,107 @@ def create_mail_keyboard() -> types.InlineKeyboardMarkup:
 
 
 @bot.message_handler(commands=['news'])
-def news_menu(message):
-    # Обмеження доступу
-    if ALLOWED_USER_ID_INT is not None and message.from_user and message.from_user.id != ALLOWED_USER_ID_INT:
-        logger.warning(f"Доступ до /news заборонено для id={message.from_user.id}")
-        bot.reply_to(message, "Вибачте, у вас немає доступу до цього бота.")
-        return
-    set_notification_chat(message.chat.id)
+@metrics.instrument('handler')
+@authorized('/news')
+def news_menu(message, user):
     kb = create_news_keyboard()
-    bot.send_message(message.chat.id, "Оберіть категорію новин:", reply_markup=kb)
+    send_message(message.chat.id, "Оберіть категорію новин:", reply_markup=kb)
 
 
 # Кнопка Пошта
 @bot.message_handler(func=lambda m: m.text == '📧 Пошта')
-def open_mail_from_button(message):
-    if ALLOWED_USER_ID_INT is not None and message.from_user and message.from_user.id != ALLOWED_USER_ID_INT:
-        logger.warning(f"Доступ до кнопки Пошта заборонено для id={message.from_user.id}")
-        bot.reply_to(message, "Вибачте, у вас немає доступу до цього бота.")
-        return
-    set_notification_chat(message.chat.id)
-    mail_menu(message)
+@metrics.instrument('handler')
+@authorized('кнопки Пошта')
+def open_mail_from_button(message, user):
+    _send_mail_menu(message.chat.id)
 
 
 # Кнопка Нотатки
 @bot.message_handler(func=lambda m: m.text == '📝 Нотатки')
-def open_notes_from_button(message):
-    if ALLOWED_USER_ID_INT is not None and message.from_user and message.from_user.id != ALLOWED_USER_ID_INT:
-        logger.warning(f"Доступ до кнопки Нотатки заборонено для id={message.from_user.id}")
-        bot.reply_to(message, "Вибачте, у вас немає доступу до цього бота.")
-        return
-    set_notification_chat(message.chat.id)
-    bot.send_message(message.chat.id, 'Нотатки: оберіть дію', reply_markup=create_notes_keyboard())
+@metrics.instrument('handler')
+@authorized('кнопки Нотатки')
+def open_notes_from_button(message, user):
+    send_message(message.chat.id, 'Нотатки: оберіть дію', reply_markup=create_notes_keyboard())
 
 
 @bot.callback_query_handler(func=lambda call: call.data in {"it_news", "ai_news", "kyiv_news", "ukraine_news", "world_news"})
-def handle_news_category(call):
-    # Обмеження доступу
-    if ALLOWED_USER_ID_INT is not None and call.from_user and call.from_user.id != ALLOWED_USER_ID_INT:
-        logger.warning(f"Доступ до новин заборонено для id={call.from_user.id}")
-        bot.answer_callback_query(call.id, "Немає доступу")
-        return
+@metrics.instrument('handler')
+@authorized('новин')
+def handle_news_category(call, user):
+    # Дайджести спільні для всіх користувачів: збір і Gemini — один раз на категорію
     category = call.data
-    bot.answer_callback_query(call.id, f"Збираю {category.replace('_', ' ')}...")
+    entry = get_stored_digest(category)
+    if entry:
+        # Готовий дайджест з фонового оновлення — відповідаємо одразу
+        bot.answer_callback_query(call.id)
+        _send_digest(call.message.chat.id, category, entry)
+        return
+    _submit_digest_job(call, category, f"Збираю {category.replace('_', ' ')}...")
+
+
+@bot.callback_query_handler(func=lambda call: call.data and call.data.startswith('news_refresh:'))
+@metrics.instrument('handler')
+@authorized('оновлення новин')
+def handle_news_refresh(call, user):
+    category = call.data.split(':', 1)[1]
+    if category not in NEWS_SOURCES:
+        bot.answer_callback_query(call.id, "Невідома категорія")
+        return
+    _submit_digest_job(call, category, f"Оновлюю {category.replace('_', ' ')}...")
+
+
+def _submit_digest_job(call, category: str, ack: str) -> None:
+    # Збір і оновлення однієї категорії в чаті — одна дія: повторне натискання не запускає другий збір
+    outcome = job_executor.submit(call.message.chat.id, f'news:{category}', f'дайджест {category.replace("_", " ")}',
+                                  _refresh_and_send_digest, call.message.chat.id, category)
+    bot.answer_callback_query(call.id, ack if outcome == 'started' else JOB_REPLIES[outcome])
+
+
+def create_digest_refresh_keyboard(category: str) -> types.InlineKeyboardMarkup:
+    kb = types.InlineKeyboardMarkup()
+    kb.add(types.InlineKeyboardButton(text='🔄 Оновити зараз', callback_data=f'news_refresh:{category}'))
+    return kb
+
+
+def _stored_digest_text(entry: dict) -> str:
+    return f"🕒 Оновлено {_format_age(_time.time() - entry['updated_at'])}\n\n{entry['text']}"
+
+
+def _send_digest(chat_id: int, category: str, entry: dict) -> None:
+    text = _stored_digest_text(entry)
+    send_long_text(chat_id, text, reply_markup=create_digest_refresh_keyboard(category))
+    logger.info('Новини надіслані користувачу')
+
+
+def _refresh_and_send_digest(chat_id: int, category: str) -> None:
     logger.info(f'Старт збору новин: {category}')
-    urls = get_category_urls(category)
-    if not urls:
-        bot.send_message(call.message.chat.id, "Немає джерел для цієї категорії.")
+    if not get_category_urls(category):
+        send_message(chat_id, "Немає джерел для цієї категорії.")
         return
-    summary = summarize_category_recent(category, urls, hours=24)
-    send_long_text(call.message.chat.id, summary)
+    # Текст дайджесту з'являється в чаті в міру генерації, а не після повної відповіді Gemini
+    writer = TelegramStreamWriter(bot, chat_id, dispatcher=send_dispatcher)
+    writer.start()
+    entry = refresh_category_digest(category, on_text=writer.update)
+    if not entry:
+        writer.finish(DIGEST_FAILED_TEXT)
+        return
+    with _digest_store_lock:
+        failed = bool(_digest_attempts.get(category, {}).get('failures'))
+    if failed:
+        # Оновлення не вдалося — показуємо збережений дайджест з його віком, а не як свіжий
+        text = f"⚠️ Оновити не вдалося, це попередній дайджест.\n{_stored_digest_text(entry)}"
+        writer.finish(text, reply_markup=create_digest_refresh_keyboard(category))
+        return
+    writer.finish(entry['text'], reply_markup=create_digest_refresh_keyboard(category))
     logger.info('Новини надіслані користувачу')
 # --------------------- END NEWS FEATURE ---------------------
 
 # Обробник команди /start
 @bot.message_handler(commands=['start'])
-def send_welcome(message):
-    bot.reply_to(message, "Привіт! Доступні команди: /news — меню новин, /mail — перегляд пошти.", reply_markup=create_main_keyboard())
-    set_notification_chat(message.chat.id)
+@metrics.instrument('handler')
+@authorized('/start')
+def send_welcome(message, user):
+    reply_to(message, "Привіт! Доступні команди: /news — меню новин, /mail — перегляд пошти.", reply_markup=create_main_keyboard())
 
 # ----------------------- NEWS FEATURE -----------------------
 
@@ -491,43 +2746,51 @@ def send_welcome(message):
 
 
 @bot.message_handler(commands=['mail'])
-def mail_menu(message):
-    if ALLOWED_USER_ID_INT is not None and message.from_user and message.from_user.id != ALLOWED_USER_ID_INT:
-        logger.warning(f"Доступ до /mail заборонено для id={message.from_user.id}")
-        bot.reply_to(message, "Вибачте, у вас немає доступу до цього бота.")
-        return
-    set_notification_chat(message.chat.id)
-    bot.send_message(message.chat.id, 'Оберіть режим перегляду пошти:', reply_markup=create_mail_keyboard())
+@metrics.instrument('handler')
+@authorized('/mail')
+def mail_menu(message, user):
+    _send_mail_menu(message.chat.id)
+
+
+def _send_mail_menu(chat_id: int) -> None:
+    send_message(chat_id, 'Оберіть режим перегляду пошти:', reply_markup=create_mail_keyboard())
+
 
+@bot.callback_query_handler(func=lambda call: call.data in {"mail_unread_12h", "mail_last_10"})
+@metrics.instrument('handler')
+@authorized('пошти')
+def handle_mail_query(call, user):
+    outcome = job_executor.submit(call.message.chat.id, 'mail', 'пошта', _mail_query_job, call.message.chat.id, call.data, user)
+    bot.answer_callback_query(call.id, 'Завантажую листи...' if outcome == 'started' else JOB_REPLIES[outcome])
 
-@bot.callback_query_handler(func=lambda call: call.data in {"mail_unread_24h", "mail_unread_7d", "mail_last_20"})
-def handle_mail_query(call):
-    if ALLOWED_USER_ID_INT is not None and call.from_user and call.from_user.id != ALLOWED_USER_ID_INT:
-        logger.warning(f"Доступ до пошти заборонено для id={call.from_user.id}")
-        bot.answer_callback_query(call.id, "Немає доступу")
+
+def _gmail_auth_hint(user: UserProfile) -> str:
+    command = 'python bot.py --gmail-auth' + (f' {user.user_id}' if user.user_id is not None else '')
+    return (f'Gmail ще не підключено ({user.gmail_token_file} відсутній). '
+            f'Власник бота має один раз виконати на сервері: {command}')
+
+
+def _mail_query_job(chat_id: int, data: str, user: UserProfile) -> None:
+    if not Path(user.gmail_token_file).exists():
+        send_message(chat_id, _gmail_auth_hint(user))
         return
-    service = get_gmail_service()
+    service = get_gmail_service(user)
     if not service:
-        bot.answer_callback_query(call.id, "Немає підключення до Gmail")
-        bot.send_message(call.message.chat.id, 'Неможливо підключитися до Gmail API. Перевірте credentials.json.')
+        send_message(chat_id, 'Неможливо підключитися до Gmail API. Перевірте credentials.json.')
         return
-    if call.data == 'mail_unread_12h':
+    if data == 'mail_unread_12h':
         query = 'label:inbox is:unread newer_than:12h'
     else:
         query = 'label:inbox newer_than:12h'
     msgs = list_messages(service, query=query, max_results=10)
     if not msgs:
-        bot.send_message(call.message.chat.id, 'Листів не знайдено за вибраним фільтром.')
+        send_message(chat_id, 'Листів не знайдено за вибраним фільтром.')
         return
-    details = []
-    for m in msgs:
-        d = fetch_message_details(service, m['id'])
-        if d:
-            details.append(d)
+    details = fetch_messages_details(service, [m['id'] for m in msgs])
     text = format_messages_markdown(details[:20])
     if not text:
         text = 'Не вдалося сформувати список листів.'
-    send_long_text(call.message.chat.id, text)
+    send_long_text(chat_id, text)
 # --------------------- END GMAIL FEATURE ---------------------
 
 
@@ -535,100 +2798,269 @@ def handle_mail_query(call):
 SHEETS_SERVICE_ACCOUNT_FILE = os.getenv('SHEETS_SERVICE_ACCOUNT_FILE', 'service_account.json')
 SHEET_NAME = os.getenv('SHEET_NAME', 'Shopping List')
 
-_gs_client = None
-_gs_sheet = None
-_last_sheet_snapshot: list[list[str]] = []
+SHEET_WATCH_RANGE = 'A:B'  # колонки, які пише бот: позиція і час додавання
 
+_gs_client = None  # один сервісний акаунт на всіх користувачів
+_gs_sheets: dict[str, object] = {}  # назва таблиці -> перший аркуш
+_gs_lock = threading.Lock()
+# Знімки для наглядача за назвою таблиці: мультимножина хешів рядків + підпис (перша колонка) для повідомлень
+_sheet_watch_states: dict[str, dict] = {}
 
-def get_sheet_client():
-    global _gs_client, _gs_sheet
-    if _gs_client and _gs_sheet:
-        return _gs_client, _gs_sheet
-    try:
-        scope = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive',
-        ]
-        creds = ServiceAccountCredentials.from_service_account_file(SHEETS_SERVICE_ACCOUNT_FILE, scopes=scope)
-        client = gspread.authorize(creds)
-        sheet = client.open(SHEET_NAME).sheet1
-        _gs_client, _gs_sheet = client, sheet
-        return client, sheet
-    except Exception as e:
-        logger.error(f'Помилка ініціалізації Google Sheets: {e}')
-        return None, None
+
+def get_sheet_client(sheet_name: str = SHEET_NAME):
+    global _gs_client
+    with _gs_lock:
+        sheet = _gs_sheets.get(sheet_name)
+        if _gs_client and sheet:
+            return _gs_client, sheet
+        try:
+            if _gs_client is None:
+                scope = [
+                    'https://www.googleapis.com/auth/spreadsheets',
+                    'https://www.googleapis.com/auth/drive',
+                ]
+                import gspread
+                from google.oauth2.service_account import Credentials as ServiceAccountCredentials
+                creds = ServiceAccountCredentials.from_service_account_file(SHEETS_SERVICE_ACCOUNT_FILE, scopes=scope)
+                _gs_client = gspread.authorize(creds)
+            sheet = _gs_client.open(sheet_name).sheet1
+            _gs_sheets[sheet_name] = sheet
+            return _gs_client, sheet
+        except Exception as e:
+            logger.error('Помилка ініціалізації Google Sheets (%s): %s', sheet_name, e)
+            return None, None
 
 
-def sheet_get_all() -> list[list[str]]:
-    _, sheet = get_sheet_client()
+@metrics.instrument('sheets_api')
+def sheet_get_all(sheet_name: str = SHEET_NAME) -> list[list[str]]:
+    _, sheet = get_sheet_client(sheet_name)
     if not sheet:
         return []
     try:
         return sheet.get_all_values()
     except Exception as e:
-        logger.error(f'Помилка читання Google Sheets: {e}')
+        logger.error('Помилка читання Google Sheets: %s', e)
         return []
 
 
-def sheet_append_row(values: list[str]) -> bool:
-    _, sheet = get_sheet_client()
+@metrics.instrument('sheets_api')
+def sheet_append_rows(rows: list[list[str]], sheet_name: str = SHEET_NAME) -> bool:
+    _, sheet = get_sheet_client(sheet_name)
     if not sheet:
         return False
     try:
-        sheet.append_row(values, value_input_option='USER_ENTERED')
+        sheet.append_rows(rows, value_input_option='USER_ENTERED')
         return True
     except Exception as e:
-        logger.error(f'Помилка додавання рядка в Google Sheets: {e}')
+        logger.error('Помилка додавання рядків в Google Sheets: %s', e)
         return False
 
 
+SHEET_APPEND_JOURNAL = Path(os.getenv('SHEET_APPEND_JOURNAL', 'list_add_journal.jsonl'))
+SHEET_APPEND_WINDOW_SEC = 2.0  # скільки чекаємо, щоб зібрати кілька /list_add в один запит
+SHEET_APPEND_GIVE_UP_SEC = 30 * 60  # після цього повідомляємо користувача про невдачу
+
+
+class SheetAppendQueue:
+    """Write-behind черга для /list_add з журналом на диску.
+
+    Позиції спершу дописуються в журнал (JSON Lines), а фоновий потік раз на вікно
+    відправляє їх одним append_rows на кожну таблицю. Невідправлені позиції переживають перезапуск і
+    недоступність Sheets; якщо відправити не вдається SHEET_APPEND_GIVE_UP_SEC,
+    користувач отримує окреме повідомлення.
+    """
+
+    def __init__(self, journal_path: Path, window_sec: float = SHEET_APPEND_WINDOW_SEC,
+                 give_up_sec: float = SHEET_APPEND_GIVE_UP_SEC):
+        self.journal_path = journal_path
+        self.window_sec = window_sec
+        self.give_up_sec = give_up_sec
+        self._cond = threading.Condition()
+        self._pending: list[dict] = []
+        self._thread: threading.Thread | None = None
+        self._load_journal()
+
+    def _load_journal(self) -> None:
+        try:
+            if not self.journal_path.exists():
+                return
+            for line in self.journal_path.read_text(encoding='utf-8').splitlines():
+                if line.strip():
+                    self._pending.append(json.loads(line))
+            if self._pending:
+                logger.info(f'Журнал /list_add: {len(self._pending)} невідправлених позицій')
+        except Exception as e:
+            logger.warning(f'Не вдалося прочитати {self.journal_path}: {e}')
+
+    def _rewrite_journal_locked(self) -> None:
+        tmp = self.journal_path.with_suffix('.tmp')
+        tmp.write_text(''.join(json.dumps(i, ensure_ascii=False) + '\n' for i in self._pending), encoding='utf-8')
+        tmp.replace(self.journal_path)
+
+    def enqueue(self, row: list[str], chat_id: int | None, sheet_name: str = SHEET_NAME) -> None:
+        item = {'id': f'{_time.time_ns()}-{threading.get_ident()}', 'row': row, 'chat_id': chat_id,
+                'sheet': sheet_name, 'queued_at': _time.time()}
+        with self._cond:
+            with open(self.journal_path, 'a', encoding='utf-8') as journal:
+                journal.write(json.dumps(item, ensure_ascii=False) + '\n')
+            self._pending.append(item)
+            self._cond.notify()
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sheet-append', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        attempt = 0
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            _time.sleep(self.window_sec)
+            with self._cond:
+                batch = list(self._pending)
+            # Записи журналу до появи кількох користувачів не мають 'sheet' — це основна таблиця
+            by_sheet: dict[str, list[dict]] = {}
+            for item in batch:
+                by_sheet.setdefault(item.get('sheet') or SHEET_NAME, []).append(item)
+            done: set[str] = set()
+            failed: list[dict] = []
+            for sheet_name, items in by_sheet.items():
+                if sheet_append_rows([i['row'] for i in items], sheet_name):
+                    done.update(i['id'] for i in items)
+                    logger.debug(f'/list_add: відправлено {len(items)} позицій у "{sheet_name}" одним запитом')
+                else:
+                    failed.extend(items)
+            if done:
+                with self._cond:
+                    self._pending = [i for i in self._pending if i['id'] not in done]
+                    self._rewrite_journal_locked()
+            if not failed:
+                attempt = 0
+                continue
+            attempt += 1
+            self._expire(failed)
+            # Експоненційна пауза між повторами, не більше 5 хвилин
+            _time.sleep(min(5 * 2 ** (attempt - 1), 300))
+
+    def _expire(self, batch: list[dict]) -> None:
+        now = _time.time()
+        expired = [i for i in batch if now - i['queued_at'] > self.give_up_sec]
+        if not expired:
+            return
+        gone = {i['id'] for i in expired}
+        with self._cond:
+            self._pending = [i for i in self._pending if i['id'] not in gone]
+            self._rewrite_journal_locked()
+        for item in expired:
+            logger.error(f'/list_add: не вдалося додати {item["row"]} за {self.give_up_sec}s, відмовляємось')
+            if item.get('chat_id'):
+                try:
+                    send_message(item['chat_id'], f'Не вдалося додати до списку: {item["row"][0]} (таблиця недоступна).')
+                except Exception as e:
+                    logger.warning(f'Не вдалося повідомити про невдале додавання: {e}')
+
+
+sheet_append_queue = SheetAppendQueue(SHEET_APPEND_JOURNAL)
+
+
 @bot.message_handler(commands=['list_add'])
-def list_add_handler(message):
-    if ALLOWED_USER_ID_INT is not None and message.from_user and message.from_user.id != ALLOWED_USER_ID_INT:
-        logger.warning(f"Доступ до /list_add заборонено для id={message.from_user.id}")
-        bot.reply_to(message, "Вибачте, у вас немає доступу до цього бота.")
-        return
+@metrics.instrument('handler')
+@authorized('/list_add')
+def list_add_handler(message, user):
     text = message.text[len('/list_add'):].strip()
     if not text:
-        bot.reply_to(message, "Формат: /list_add продукт [x кількість]")
+        reply_to(message, "Формат: /list_add продукт [x кількість]")
         return
-    ok = sheet_append_row([text, datetime.utcnow().isoformat()])
-    if ok:
-        bot.reply_to(message, f'Додано в список: {text}')
-    else:
-        bot.reply_to(message, 'Не вдалося додати до списку (перевірте доступи до таблиці).')
+    # Запис у таблицю відбувається у фоні; про невдачу прийде окреме повідомлення
+    sheet_append_queue.enqueue([text, datetime.utcnow().isoformat()], message.chat.id, user.sheet_name)
+    reply_to(message, f'Додано в список: {text}')
 
 
-def sheets_watcher_loop(interval_sec: int = 30) -> None:
-    global _last_sheet_snapshot
-    # Ініціальна зйомка
-    _last_sheet_snapshot = sheet_get_all()
-    while True:
-        try:
-            curr = sheet_get_all()
-            if curr and curr != _last_sheet_snapshot:
-                # Знайдемо нові рядки (простий diff: по довжині і вмісту)
-                new_rows = []
-                if len(curr) > len(_last_sheet_snapshot):
-                    new_rows = curr[len(_last_sheet_snapshot):]
-                else:
-                    # Зміни в середині — знайдемо різницю
-                    old_set = {tuple(r) for r in _last_sheet_snapshot}
-                    for r in curr:
-                        if tuple(r) not in old_set:
-                            new_rows.append(r)
-                for r in new_rows:
-                    item = r[0] if r else '(порожньо)'
-                    msg = f'У список додано: {item}'
-                    if _notification_chat_id:
-                        bot.send_message(_notification_chat_id, msg)
-                    elif ALLOWED_USER_ID_INT:
-                        bot.send_message(ALLOWED_USER_ID_INT, msg)
-                _last_sheet_snapshot = curr
-        except Exception as e:
-            logger.error(f'Sheets watcher error: {e}')
-        finally:
-            _time.sleep(interval_sec)
+def _row_hash(row: list[str]) -> bytes:
+    return hashlib.blake2b('\x1f'.join(str(c) for c in row).encode('utf-8'), digest_size=8).digest()
+
+
+def sheet_snapshot(rows: list[list[str]]) -> tuple[Counter, dict[bytes, str]]:
+    counts: Counter = Counter()
+    labels: dict[bytes, str] = {}
+    for r in rows:
+        h = _row_hash(r)
+        counts[h] += 1
+        if h not in labels:
+            labels[h] = (r[0].strip() if r and str(r[0]).strip() else '(порожньо)')[:100]
+    return counts, labels
+
+
+def diff_sheet_snapshots(old: Counter, new: Counter) -> tuple[list[bytes], list[bytes]]:
+    """(додані, видалені) хеші з урахуванням дублікатів рядків."""
+    return list((new - old).elements()), list((old - new).elements())
+
+
+@metrics.instrument('sheets_api')
+def sheet_modified_marker(sheet) -> str | None:
+    # Drive modifiedTime — дешевий запит метаданих; None, якщо недоступний (тоді читаємо діапазон щоразу)
+    try:
+        return sheet.spreadsheet.get_lastUpdateTime()
+    except Exception as e:
+        logger.debug('Не вдалося отримати modifiedTime таблиці: %s', e, extra=LOG_SAMPLED)
+        return None
+
+
+def sheets_watch_tick(sheet_name: str = SHEET_NAME, state: dict | None = None) -> tuple[list[str], list[str]]:
+    """Один тік наглядача таблиці: повертає (додані, видалені) позиції з часу попереднього тіку.
+
+    Діапазон читається лише коли змінився modifiedTime таблиці; перший успішний тік лише знімає знімок.
+    """
+    if state is None:
+        state = _sheet_watch_states.setdefault(sheet_name, {'modified': None, 'counts': None, 'labels': {}})
+    _, sheet = get_sheet_client(sheet_name)
+    if not sheet:
+        return [], []
+    marker = sheet_modified_marker(sheet)
+    if marker is not None and marker == state['modified'] and state['counts'] is not None:
+        return [], []
+    with metrics.timed('sheets_api', op='get_range'):
+        rows = [list(r) for r in sheet.get(SHEET_WATCH_RANGE)]
+    counts, labels = sheet_snapshot(rows)
+    old_counts, old_labels = state['counts'], state['labels']
+    state.update(modified=marker, counts=counts, labels=labels)
+    if old_counts is None:
+        return [], []
+    added, removed = diff_sheet_snapshots(old_counts, counts)
+    return [labels[h] for h in added], [old_labels.get(h, '(порожньо)') for h in removed]
+
+
+def _notify_sheet_change(user: UserProfile, msg: str) -> None:
+    chat_id = user.notify_chat_id
+    if chat_id:
+        send_message(chat_id, msg)
+
+
+def sheets_watcher_tick() -> bool:
+    """Один прохід наглядача по всіх таблицях; True, якщо якийсь список змінився.
+
+    Спільна таблиця кількох користувачів читається один раз за тік, а зміни отримує кожен з них.
+    """
+    subscribers: dict[str, list[UserProfile]] = {}
+    for user in user_registry.all():
+        subscribers.setdefault(user.sheet_name, []).append(user)
+
+    def watch(sheet_name: str) -> bool:
+        added, removed = sheets_watch_tick(sheet_name)
+        msgs = [f'У список додано: {item}' for item in added] + [f'Зі списку видалено: {item}' for item in removed]
+        for user in subscribers[sheet_name]:
+            for msg in msgs:
+                _notify_sheet_change(user, msg)
+        return bool(msgs)
+
+    return run_for_each('Sheets watcher', list(subscribers), watch)
 # --------------------- END GOOGLE SHEETS ---------------------
 
 
@@ -659,17 +3091,216 @@ def format_sheet_list(rows: list[list[str]]) -> str:
 
 
 @bot.callback_query_handler(func=lambda call: call.data in {'notes_show','notes_add'})
-def handle_notes_actions(call):
-    if ALLOWED_USER_ID_INT is not None and call.from_user and call.from_user.id != ALLOWED_USER_ID_INT:
-        logger.warning(f"Доступ до нотаток заборонено для id={call.from_user.id}")
-        bot.answer_callback_query(call.id, "Немає доступу")
-        return
+@metrics.instrument('handler')
+@authorized('нотаток')
+def handle_notes_actions(call, user):
     if call.data == 'notes_show':
-        rows = sheet_get_all()
-        text = format_sheet_list(rows)
-        send_long_text(call.message.chat.id, text)
+        outcome = job_executor.submit(call.message.chat.id, 'notes_show', 'список', _notes_show_job,
+                                      call.message.chat.id, user.sheet_name)
+        bot.answer_callback_query(call.id, None if outcome == 'started' else JOB_REPLIES[outcome])
     else:  # notes_add
-        bot.send_message(call.message.chat.id, "Надішліть позицію у форматі: /list_add назва [x кількість]")
+        bot.answer_callback_query(call.id)
+        send_message(call.message.chat.id, "Надішліть позицію у форматі: /list_add назва [x кількість]")
+
+
+def _notes_show_job(chat_id: int, sheet_name: str) -> None:
+    rows = sheet_get_all(sheet_name)
+    send_long_text(chat_id, format_sheet_list(rows))
+
+
+# ----------------------- WEBHOOK -----------------------
+# BOT_MODE=webhook: Telegram сам надсилає апдейти на WEBHOOK_URL замість довгого getUpdates
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # публічна https-адреса, напр. https://example.com/tg (проксі → WEBHOOK_PORT)
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+WEBHOOK_MAX_BODY = 1024 * 1024
+
+
+class _WebhookHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # стандартних 5 замало для сплеску апдейтів — з'єднання чекали б повтору SYN
+
+
+class WebhookServer:
+    """Локальний HTTP-сервер для апдейтів Telegram.
+
+    Перевіряє X-Telegram-Bot-Api-Secret-Token, одразу відповідає 200 і передає апдейт
+    у bot.process_new_updates на окремому пулі, щоб повільний обробник не затримував Telegram.
+    """
+
+    def __init__(self, bot_, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT, path: str = '/',
+                 secret: str = WEBHOOK_SECRET, workers: int = WEBHOOK_WORKERS):
+        self.bot = bot_
+        self.path = path or '/'
+        self.secret = secret
+        self.stats = {'accepted': 0, 'rejected': 0, 'bad': 0}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhook')
+        self.httpd = _WebhookHTTPServer((listen, port), self._handler_class())
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                status = server.handle_post(self.path, self.headers, self.rfile)
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, fmt, *args):
+                logger.debug('Webhook: ' + fmt, *args)
+
+        return Handler
+
+    def handle_post(self, path: str, headers, body_stream) -> int:
+        if path.split('?', 1)[0] != self.path:
+            return 404
+        if self.secret and not hmac.compare_digest(headers.get('X-Telegram-Bot-Api-Secret-Token', ''), self.secret):
+            self.stats['rejected'] += 1
+            logger.warning('Webhook: невірний secret token, апдейт відхилено')
+            return 403
+        length = int(headers.get('Content-Length') or 0)
+        if length <= 0 or length > WEBHOOK_MAX_BODY:
+            self.stats['bad'] += 1
+            return 400
+        try:
+            update = types.Update.de_json(body_stream.read(length).decode('utf-8'))
+        except Exception as e:
+            self.stats['bad'] += 1
+            logger.warning('Webhook: не вдалося розібрати апдейт: %s', e)
+            return 400
+        self.stats['accepted'] += 1
+        self._pool.submit(self._process, update)
+        return 200
+
+    def _process(self, update) -> None:
+        try:
+            self.bot.process_new_updates([update])
+        except Exception as e:
+            logger.error(f'Webhook: помилка обробки апдейту {update.update_id}: {e}')
+
+    def start(self) -> threading.Thread:
+        t = threading.Thread(target=self.httpd.serve_forever, name='webhook-http', daemon=True)
+        t.start()
+        return t
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self._pool.shutdown(wait=False)
+
+
+def run_webhook() -> None:
+    """Реєструє webhook у Telegram і обслуговує апдейти до зупинки процесу."""
+    if not WEBHOOK_URL:
+        raise RuntimeError('BOT_MODE=webhook потребує WEBHOOK_URL')
+    if not WEBHOOK_SECRET:
+        logger.warning('WEBHOOK_SECRET не задано — апдейти приймаються без перевірки джерела')
+    server = WebhookServer(bot, path=urlparse(WEBHOOK_URL).path)
+    bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None)
+    logger.info(f'Webhook: слухаю {WEBHOOK_LISTEN}:{server.port}{server.path}, Telegram → {WEBHOOK_URL}')
+    report_startup_profile('webhook готовий')
+    server.httpd.serve_forever()
+
+
+def run_polling() -> None:
+    try:
+        # Якщо раніше працював webhook, Telegram не віддасть getUpdates, поки його не зняти
+        bot.remove_webhook()
+    except Exception as e:
+        logger.warning(f'Не вдалося зняти webhook: {e}')
+    bot.polling()
+
+
+@bot.message_handler(commands=['stats'])
+@metrics.instrument('handler')
+@authorized('/stats')
+def stats_command(message, user):
+    # Лише власник: метрики розкривають внутрішню активність бота
+    if not user.owner:
+        return
+    if not metrics.enabled:
+        reply_to(message, 'Метрики вимкнено (METRICS_ENABLED=0).')
+        return
+    lines = metrics.summary_lines() or ['(поки порожньо)']
+    lines.append('')
+    lines.append(f'Jobs: {job_executor.stats()}')
+    lines.append(f'Черга відправки: {send_dispatcher.pending_count()} в очікуванні, {send_dispatcher.stats}')
+    lines.append(f'Кеш скрапінгу: {scrape_cache.stats()}; дайджести: {_digest_stats}')
+    lines.append(f'Користувачів: {len(user_registry.all())}')
+    send_long_text(message.chat.id, '\n'.join(lines))
+
+
+def start_metrics_server(port: int = METRICS_PORT, listen: str = METRICS_LISTEN) -> ThreadingHTTPServer | None:
+    """Prometheus-текст на /metrics; за замовчуванням лише локально."""
+    if not port or not metrics.enabled:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = metrics.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((listen, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f'Метрики: http://{listen}:{httpd.server_address[1]}/metrics')
+    return httpd
+
+
+def _log_background_stats() -> None:
+    logger.info(f'Scheduler: {scheduler.stats()}')
+    for user in user_registry.all():
+        gmail_stats = user.gmail_stats()
+        if gmail_stats is not None:
+            logger.info(f'Gmail service manager ({user}): {gmail_stats}')
+    logger.info(f'Jobs: {job_executor.stats()}; черга відправки: {send_dispatcher.pending_count()}')
+
+
+def gmail_token_refresh_tick() -> None:
+    run_for_each('Gmail token refresh', user_registry.all(), UserProfile.refresh_gmail_ahead)
+
+
+def gmail_seen_maintain_tick() -> None:
+    run_for_each('Gmail seen store', user_registry.all(), UserProfile.maintain_gmail_seen)
+
+
+def register_periodic_tasks() -> None:
+    """Усі фонові періодичні задачі бота — в одному планувальнику."""
+    # Наглядачі обходять усіх користувачів у своїй одній задачі — без потоку на користувача: частіше після змін, рідше в тиші чи при помилках
+    scheduler.add('gmail_watcher', gmail_watcher_tick, interval=60, max_interval=300)
+    scheduler.add('sheets_watcher', sheets_watcher_tick, interval=30, max_interval=300, initial_delay=5)
+    scheduler.add('gmail_token_refresh', gmail_token_refresh_tick, interval=60)
+    scheduler.add('gmail_seen_maintain', gmail_seen_maintain_tick, interval=SeenMessageStore.MAINTAIN_EVERY_SEC,
+                  initial_delay=SeenMessageStore.MAINTAIN_EVERY_SEC)
+    scheduler.add('stats_log', _log_background_stats, interval=3600, initial_delay=3600)
+    if NEWS_REFRESH_ENABLED:
+        scheduler.add('news_refresh', news_refresh_tick, interval=NEWS_REFRESH_STAGGER_SEC,
+                      max_interval=max(NEWS_REFRESH_STAGGER_SEC, 600), initial_delay=10,
+                      overrun_sec=NEWS_TIME_BUDGET_SEC + 60)
+
+
+def _handle_stop_signal(signum, _frame) -> None:
+    logger.info(f'Отримано сигнал {signum}, зупиняюсь')
+    scheduler.stop()
+    raise SystemExit(0)
 
 
 # Реєстрація команд бота (меню команд у Telegram)
@@ -685,14 +3316,89 @@ def register_bot_commands() -> None:
         logger.warning(f'Не вдалося зареєструвати команди бота: {e}')
 
 
+# ----------------------- ПРОФІЛЬ СТАРТУ -----------------------
+STARTUP_PROFILE_TOP = 15
+_STARTUP_MODULE_LOADED = _time.perf_counter() - _STARTUP_T0
+
+
+def _process_age_sec() -> float | None:
+    """Скільки секунд живе процес (Linux /proc); None, якщо визначити не вдалось."""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def report_startup_profile(stage: str) -> None:
+    """Логує час до stage і найдовші import-и; після звіту перехоплення import вимикається."""
+    if not _STARTUP_PROFILE:
+        return
+    builtins.__import__ = _builtin_import
+    elapsed = _time.perf_counter() - _STARTUP_T0
+    age = _process_age_sec()
+    age_note = f', {age:.2f}s від старту процесу' if age is not None else ''
+    eager = [t for t in _import_timings if t[2] < _STARTUP_MODULE_LOADED]
+    lazy = [t for t in _import_timings if t[2] >= _STARTUP_MODULE_LOADED]
+    logger.info(f'Профіль старту: {stage} через {elapsed:.3f}s від початку bot.py{age_note}; '
+                f'модуль завантажено за {_STARTUP_MODULE_LOADED:.3f}s, з них import-и {sum(t[1] for t in eager):.3f}s')
+    for name, took, _at in sorted(eager, key=lambda t: -t[1])[:STARTUP_PROFILE_TOP]:
+        logger.info(f'  import {name}: {took * 1000:.1f}ms')
+    for name, took, at in lazy:
+        if took >= 0.001:
+            logger.info(f'  відкладений import {name}: {took * 1000:.1f}ms (на {at:.2f}s)')
+
+
+def install_startup_probe() -> None:
+    """Звіт профілю при першому getUpdates — момент, коли бот реально готовий приймати апдейти."""
+    original = telebot.apihelper.get_updates
+
+    def probe(*args, **kwargs):
+        telebot.apihelper.get_updates = original
+        report_startup_profile('перший getUpdates')
+        return original(*args, **kwargs)
+
+    telebot.apihelper.get_updates = probe
+
+
+def authorize_gmail(user_id: str | None) -> int:
+    """--gmail-auth [USER_ID]: браузерна OAuth-авторизація Gmail у передньому плані, створює token-файл користувача."""
+    if user_id is None:
+        user = next((u for u in user_registry.all() if u.primary), None)
+    else:
+        user = user_registry.get(int(user_id) if user_id.isdigit() else None)
+    if user is None:
+        print(f'Користувача {user_id} немає в реєстрі (config.json "users" / ALLOWED_USER_ID)', file=sys.stderr)
+        return 1
+    if user.gmail.service(interactive=True) is None:
+        print('Авторизація Gmail не вдалася, див. лог', file=sys.stderr)
+        return 1
+    print(f'Gmail для {user} підключено: {user.gmail_token_file}')
+    return 0
+
+
 # Запуск бота
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--gmail-auth':
+        sys.exit(authorize_gmail(sys.argv[2] if len(sys.argv) > 2 else None))
     try:
+        if _STARTUP_PROFILE:
+            install_startup_probe()
         # Стартуємо фонові наглядачі
-        threading.Thread(target=gmail_watcher_loop, args=(60,), daemon=True).start()
-        threading.Thread(target=sheets_watcher_loop, args=(30,), daemon=True).start()
+        register_periodic_tasks()
+        scheduler.start()
+        signal.signal(signal.SIGTERM, _handle_stop_signal)
+        signal.signal(signal.SIGINT, _handle_stop_signal)
+        sheet_append_queue.start()
+        start_metrics_server()
         register_bot_commands()
-        logger.info("Бот успішно запущений")
-        bot.polling()
+        logger.info(f"Бот успішно запущений (режим {BOT_MODE})")
+        if BOT_MODE == 'webhook':
+            run_webhook()
+        else:
+            run_polling()
     except Exception as e:
         logger.error(f"Помилка під час запуску бота: {e}") 
\ No newline at end of file